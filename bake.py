@@ -0,0 +1,156 @@
+import argparse
+import math
+import mmap
+import multiprocessing as mp
+from multiprocessing.connection import wait
+import os
+import random
+import sys
+import time
+
+from colors import mix_frames
+from control import WiredPattern
+from core import Blender, Lights, OfflineLights
+from framefile import FrameHeader, layout_hash, load_layouts, save_layouts
+from patterns import find_pattern, load_pattern
+
+# renders `seconds` of `pattern` at `fps` on an injected clock and writes the
+# encoded frames to `path`. With `loop`, that many seconds more are rendered
+# past the end and cross-faded into the start, so the last frame runs
+# straight on into the first.
+#
+# stepping the blender from tick to tick has to happen in order, drawing and
+# encoding doesn't. This process steps through every tick once, and at the
+# start of each chunk of ticks forks a worker that inherits the state for
+# that tick and draws, encodes and steps through just its chunk, straight
+# into the mapped file. Up to `workers` chunks render while the stepping
+# moves on to the next one
+def bake(pattern: WiredPattern,
+         layouts: list[list[dict]],
+         path: str,
+         seconds: float,
+         fps: float=16,
+         workers: int | None=None,
+         seed: int=0,
+         loop: float=0.0) -> FrameHeader:
+    workers = workers or os.cpu_count() or 1
+    # an unconfigured pattern gets randomized when the blender starts
+    random.seed(seed)
+    blender = Blender([pattern], 0, True, fps=fps, lights=OfflineLights(layouts))
+    header = FrameHeader(blender.lights.counts, fps, int(seconds * fps), layout_hash(layouts), int(loop * fps))
+    if header.fade > header.frames:
+        raise ValueError(f"Can't cross-fade {loop}s of a {seconds}s loop")
+    ticks = header.frames + header.fade
+
+    with open(path, 'wb') as file:
+        file.write(header.pack())
+        file.truncate(header.offset(ticks))
+    with open(path, 'r+b') as file:
+        data = mmap.mmap(file.fileno(), 0)
+
+    blender.init(0.0)
+
+    def step(tick: int):
+        blender.seed_tick(seed, tick)
+        blender.advance(tick / fps)
+
+    def render(first: int, last: int):
+        view = memoryview(data)
+        for tick in range(first, last):
+            step(tick)
+            offset = header.offset(tick)
+            frames = []
+            for start, count in zip(blender.lights.offsets, blender.lights.counts):
+                frames.append(view[offset + (4 * start):offset + (4 * (start + count))])
+            blender.encode(blender.draw(tick / fps), frames)
+            del frames
+        view.release()
+
+    if workers == 1:
+        render(0, ticks)
+    else:
+        # enough chunks that a slow one doesn't leave the other workers idle
+        chunk = max(1, math.ceil(ticks / (workers * 4)))
+        context = mp.get_context("fork")
+        running = []
+        failed = []
+        for first in range(0, ticks, chunk):
+            last = min(first + chunk, ticks)
+            while len(running) >= workers:
+                wait([process.sentinel for process in running])
+                for process in [process for process in running if not process.is_alive()]:
+                    process.join()
+                    running.remove(process)
+                    if process.exitcode != 0:
+                        failed.append(process.exitcode)
+            process = context.Process(target=render, args=(first, last))
+            process.start()
+            running.append(process)
+            for tick in range(first, last):
+                step(tick)
+        for process in running:
+            process.join()
+            if process.exitcode != 0:
+                failed.append(process.exitcode)
+        if failed:
+            raise RuntimeError(f"Bake workers failed with exit codes {failed}")
+
+    if header.fade:
+        view = memoryview(data)
+        for idx in range(header.fade):
+            start = header.offset(idx)
+            past_end = header.offset(header.frames + idx)
+            mix_frames(
+                view[start:start + header.frame_bytes],
+                view[past_end:past_end + header.frame_bytes],
+                1 - (idx / header.fade),
+            )
+        view.release()
+
+    data.flush()
+    data.close()
+    with open(path, 'r+b') as file:
+        file.truncate(header.offset(header.frames))
+    return header
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="render a pattern to a frame file without any devices")
+    parser.add_argument("pattern", nargs="?", help="pattern class or name, with its saved .pattern config if there is one")
+    parser.add_argument("-o", "--output", help="frame file to write, defaults to <pattern>.frames")
+    parser.add_argument("--layout", default="layout.json",
+                        help="LED layouts as saved by --save-layout")
+    parser.add_argument("--save-layout", action="store_true",
+                        help="discover the controllers, save their layouts to --layout and exit")
+    parser.add_argument("--hosts", nargs="+", metavar="HOST",
+                        help="with --save-layout, the controllers to save instead of discovering them")
+    parser.add_argument("--seconds", type=float, default=60, help="length of the file")
+    parser.add_argument("--loop", type=float, default=0.0, metavar="SECONDS",
+                        help="render this much more and cross-fade it into the start so the file loops "
+                             "seamlessly, instead of a fixed duration that jumps back to the start")
+    parser.add_argument("--fps", type=float, default=16)
+    parser.add_argument("--workers", type=int, help="processes to render with, defaults to every core")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.save_layout:
+        layouts = [interface.layout for interface in Lights(hosts=args.hosts).interfaces]
+        save_layouts(args.layout, layouts)
+        print(f"Saved {len(layouts)} layouts to {args.layout}")
+        sys.exit(0)
+    if not args.pattern:
+        parser.error("a pattern is required")
+    if args.loop > args.seconds:
+        parser.error("--loop can't be longer than --seconds")
+
+    pattern = load_pattern(find_pattern(args.pattern))
+    output = args.output or f"{pattern.name.replace(' ', '_').lower()}.frames"
+    start = time.perf_counter()
+    header = bake(
+        pattern, load_layouts(args.layout), output, args.seconds, args.fps, args.workers, args.seed, args.loop,
+    )
+    elapsed = time.perf_counter() - start
+    print(
+        f"Baked {header} to {output} in {elapsed:.2f}s,",
+        f"{(header.frames + header.fade) / elapsed:.0f} frames/s,",
+        f"{(header.frames + header.fade) / header.fps / elapsed:.1f}x realtime",
+    )
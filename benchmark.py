@@ -0,0 +1,150 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from control import WiredPattern
+from core import Blender, OfflineLights
+from emulator import cone_layout
+from patterns import PATTERNS, load_pattern, pattern_file
+
+CASES = ["random", "saved", "transition"]
+
+# `leds` LEDs on one cone, dealt out to controllers of at most `per_device`
+def synthetic_layouts(leds: int, per_device: int=1000) -> list[list[dict]]:
+    layout = cone_layout(leds, turns=max(12.0, leds / 100))
+    devices = math.ceil(leds / per_device)
+    size = math.ceil(leds / devices)
+    return [layout[i:i + size] for i in range(0, leds, size)]
+
+def _saved(pattern: WiredPattern) -> bool:
+    return os.path.exists(pattern_file(pattern))
+
+# a blender for one case that starts at t=0 with nothing left to chance:
+# "random" runs a fresh randomized pattern, "saved" its .pattern config and
+# "transition" cross-fades from the randomized pattern into the next one
+def _blender(idx: int, case: str, layouts: list[list[dict]], fps: float, vectorized: bool,
+             seed: int) -> Blender:
+    random.seed(seed)
+    np.random.seed(seed)
+    pattern = PATTERNS[idx]()
+    if case == "saved":
+        load_pattern(pattern)
+    patterns = [pattern]
+    if case == "transition":
+        patterns.append(PATTERNS[(idx + 1) % len(PATTERNS)]())
+    blender = Blender(patterns, 0, True, vectorized=vectorized, fps=fps, lights=OfflineLights(layouts))
+    blender.init(0.0)
+    if case == "transition":
+        blender.start_transition(1)
+        # keep drawing both patterns however many frames run
+        blender.pattern_end = math.inf
+    return blender
+
+def _frame(blender: Blender, seed: int, tick: int, fps: float):
+    blender.seed_tick(seed, tick)
+    blender.encode(blender.render(tick / fps))
+
+# renders and encodes `frames` frames on a clock running at `fps`, with the
+# frame times from one pass and the peak memory each frame allocates from a
+# second, shorter pass under tracemalloc so tracing doesn't skew the times
+def bench(idx: int, case: str, layouts: list[list[dict]], frames: int=100, fps: float=16,
+          vectorized: bool=True, warmup: int=5, alloc_frames: int=20, seed: int=0) -> dict:
+    blender = _blender(idx, case, layouts, fps, vectorized, seed)
+    for tick in range(warmup):
+        _frame(blender, seed, tick, fps)
+    times = np.empty(frames)
+    for i in range(frames):
+        start = time.perf_counter()
+        _frame(blender, seed, warmup + i, fps)
+        times[i] = time.perf_counter() - start
+
+    blender = _blender(idx, case, layouts, fps, vectorized, seed)
+    _frame(blender, seed, 0, fps)
+    allocs = np.empty(alloc_frames)
+    tracemalloc.start()
+    try:
+        for i in range(alloc_frames):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            _frame(blender, seed, 1 + i, fps)
+            allocs[i] = tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "pattern": blender.patterns[0].name,
+        "case": case,
+        "leds": len(blender.field),
+        "devices": len(layouts),
+        "frames": frames,
+        "fps": frames / times.sum(),
+        "mean_ms": times.mean() * 1000,
+        "p50_ms": np.percentile(times, 50) * 1000,
+        "p99_ms": np.percentile(times, 99) * 1000,
+        "max_ms": times.max() * 1000,
+        "alloc_p50_kb": np.percentile(allocs, 50) / 1024,
+        "alloc_max_kb": allocs.max() / 1024,
+    }
+
+def run(leds: list[int], patterns: list[int], cases: list[str], frames: int=100, fps: float=16,
+        vectorized: bool=True, seed: int=0, file=sys.__stdout__) -> dict:
+    results = []
+    for count in leds:
+        layouts = synthetic_layouts(count)
+        for idx in patterns:
+            for case in cases:
+                if case == "saved" and not _saved(PATTERNS[idx]()):
+                    continue
+                result = bench(idx, case, layouts, frames, fps, vectorized, seed=seed)
+                results.append(result)
+                print(
+                    f"{result['pattern']:>14} {case:>10} {count:>6} LEDs: {result['fps']:8.1f} fps,",
+                    f"p50 {result['p50_ms']:7.2f}ms, p99 {result['p99_ms']:7.2f}ms,",
+                    f"allocs {result['alloc_p50_kb']:8.1f}kB",
+                    file=file,
+                    flush=True,
+                )
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "engine": "vector" if vectorized else "pixel",
+        "fps": fps,
+        "seed": seed,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time every pattern per frame on synthetic layouts")
+    parser.add_argument("--leds", type=int, nargs="+", default=[800, 5000, 50000])
+    parser.add_argument("--patterns", nargs="+", metavar="CLASS",
+                        help="pattern classes to run, defaults to all of them")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--engine", choices=["vector", "pixel"], default="vector")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--fps", type=float, default=16, help="frame rate of the simulated clock")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="benchmark.json")
+    args = parser.parse_args()
+
+    names = [cls.__name__ for cls in PATTERNS]
+    for name in args.patterns or []:
+        if name not in names:
+            parser.error(f"no pattern class {name}, choose from {', '.join(names)}")
+    patterns = [names.index(name) for name in args.patterns] if args.patterns else range(len(PATTERNS))
+    # load_pattern reports on every configuration it looks for
+    sys.stdout = open(os.devnull, 'w')
+    report = run(args.leds, patterns, args.cases, args.frames, args.fps, args.engine == "vector", args.seed)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}", file=sys.__stdout__)
@@ -1,7 +1,10 @@
 from enum import Enum
-from typing import Callable, TypeAlias
+import time
+from typing import Any, Callable, TypeAlias
+import numpy as np
 from pytweening import linear, easeInOutCubic
 import struct
+from xled_plus import ledcolor
 from xled_plus.ledcolor import hsl_color, set_color_style
 
 from param import Param, Curve, getv, const, rand
@@ -58,7 +61,8 @@ class Color:
             h = getv(self.h, t)
             s = getv(self.s, t)
             l = getv(self.l, t)
-            rgb = hsl_color(h, s, l)
+            table = hsl_table()
+            rgb = hsl_color(h, s, l) if table is None else table.color(h, s, l)
             return struct.pack('>BBBB', int(w * 255), *rgb)
         except Exception:
             raise ValueError("OOPS", self)
@@ -66,6 +70,310 @@ class Color:
     def __repr__(self):
         return f"{self.w} {self.h} {self.s} {self.l}"
 
+# array version of ledcolor.hsl_color, step for step so the bytes match
+def hsl_colors(h: np.ndarray, s: np.ndarray, l: np.ndarray) -> np.ndarray:
+    circle, policy = ledcolor.get_color_style()
+    hramp = np.array(ledcolor.col_styles_dict[circle])
+    balance = ledcolor.led_balance
+    brightness = ledcolor.led_brightness
+    ir = 1.0 / balance[0]
+    ig = 1.0 / balance[1]
+    ib = 1.0 / balance[2]
+    irg = min(ir, ig)
+    irb = min(ir, ib)
+    igb = min(ig, ib)
+    iramp = np.array([
+        (0, 0, ib),
+        (0, igb / 2, igb / 2),
+        (0, ig, 0),
+        (irg / 2, irg / 2, 0),
+        (ir, 0, 0),
+        (irb / 2, 0, irb / 2),
+        (0, 0, ib),
+    ])
+
+    i = np.searchsorted(hramp[1:], h, side='left')
+    p = (h - hramp[i]) / (hramp[i + 1] - hramp[i])
+    x1 = iramp[i]
+    x2 = iramp[i + 1]
+    rgb = (p[:, None] * (x2 - x1)) + x1
+    nrm = np.maximum(np.maximum(rgb[:, 0] / ir, rgb[:, 1] / ig), rgb[:, 2] / ib)
+    rgb /= nrm[:, None]
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+
+    ll = (l + 1.0) * 0.5
+    if policy == "linear":
+        dark = ll < 0.5
+        t1 = np.where(dark, l + 1.0, 1.0 - l)
+        t2 = np.where(dark, 0.0, l)
+    else:
+        br = (r * brightness[0]) + (g * brightness[1]) + (b * brightness[2])
+        e = np.maximum(np.maximum(r, g), b)
+        p = np.minimum(
+            np.minimum(1.0, (1.0 - ll / e) / (1.0 - br)),
+            (1.0 - ll * balance[1]) / (1.0 - brightness[1]),
+        )
+        t1 = ll * p / ((br - e) * p + e)
+        t2 = np.maximum(0.0, ll - t1 * br)
+    t1 = s * t1
+    t2 = s * t2 + ll * (1.0 - s)
+
+    rgb *= t1[:, None]
+    rgb += t2[:, None]
+    if ledcolor.led_gamma != 1.0:
+        rgb **= ledcolor.led_gamma
+    rgb *= 255 * np.array(balance)
+    return np.clip(np.trunc(rgb), 0, 255).astype(np.uint8)
+
+# hsl_colors over every (h, s, l) combination, a hue at a time to bound memory
+def hsl_grid(h: np.ndarray, s: np.ndarray, l: np.ndarray) -> np.ndarray:
+    grid = np.empty((len(h), len(s), len(l), 3), dtype=np.uint8)
+    s, l = (v.ravel() for v in np.meshgrid(s, l, indexing='ij'))
+    for i, hue in enumerate(h.tolist()):
+        grid[i] = hsl_colors(np.full(len(s), hue), s, l).reshape(grid.shape[1:])
+    return grid
+
+# hsl_colors sampled on a grid, looked up by nearest grid point. Saturation
+# and lightness are sampled at both ends, so every axis needs two steps
+class HSLTable:
+    def __init__(self, h_steps: int=256, s_steps: int=32, l_steps: int=128):
+        if min(h_steps, s_steps, l_steps) < 2:
+            raise ValueError(f"HSL table needs at least 2 steps per channel, got {(h_steps, s_steps, l_steps)}")
+        start = time.perf_counter()
+        self.style = ledcolor.get_color_style()
+        self.steps = (h_steps, s_steps, l_steps)
+        self.table = hsl_grid(
+            np.arange(h_steps) / h_steps,
+            np.linspace(0.0, 1.0, s_steps),
+            np.linspace(-1.0, 1.0, l_steps),
+        )
+        self._bytes = self.table.tobytes()
+        self.build_time = time.perf_counter() - start
+
+    def _index(self, h, s, l):
+        h_steps, s_steps, l_steps = self.steps
+        return (
+            np.rint(h * h_steps).astype(np.int64) % h_steps,
+            np.rint(s * (s_steps - 1)).astype(np.int64),
+            np.rint((l + 1.0) * 0.5 * (l_steps - 1)).astype(np.int64),
+        )
+
+    def colors(self, h: np.ndarray, s: np.ndarray, l: np.ndarray) -> np.ndarray:
+        return self.table[self._index(h, s, l)]
+
+    def color(self, h: float, s: float, l: float) -> tuple[int, int, int]:
+        h_steps, s_steps, l_steps = self.steps
+        idx = (
+            (((round(h * h_steps) % h_steps) * s_steps) + round(s * (s_steps - 1))) * l_steps
+          + round((l + 1.0) * 0.5 * (l_steps - 1))
+        ) * 3
+        return tuple(self._bytes[idx:idx + 3])
+
+    # worst channel difference from the exact colors, measured at the centers
+    # of the grid cells where every input is as far from a sample as it gets
+    def max_error(self) -> int:
+        h_steps, s_steps, l_steps = self.steps
+        h = (np.arange(h_steps) + 0.5) / h_steps
+        s = (np.arange(s_steps - 1) + 0.5) / (s_steps - 1)
+        l = (((np.arange(l_steps - 1) + 0.5) / (l_steps - 1)) * 2) - 1
+        exact = hsl_grid(h, s, l).astype(np.int16)
+        h, s, l = np.meshgrid(h, s, l, indexing='ij')
+        return int(np.abs(self.colors(h, s, l).astype(np.int16) - exact).max())
+
+    def __repr__(self):
+        return f"HSLTable({self.style}, {self.steps})"
+
+_hsl_tables: dict[tuple, HSLTable] = {}
+_hsl_table_steps: tuple[int, int, int] | None = None
+
+def use_hsl_table(steps: tuple[int, int, int] | None=(256, 32, 128)):
+    global _hsl_table_steps
+    _hsl_table_steps = steps
+
+# the table for the current color style, built the first time that style is used
+def hsl_table() -> HSLTable | None:
+    if _hsl_table_steps is None:
+        return None
+    key = (ledcolor.get_color_style(), _hsl_table_steps)
+    if key not in _hsl_tables:
+        _hsl_tables[key] = HSLTable(*_hsl_table_steps)
+    return _hsl_tables[key]
+
+# whole-frame Color.as_byte: w, r, g, b per LED written straight into `out`
+def encode(colors: 'Colors', out: bytearray, start: int=0):
+    end = start + (len(out) // 4)
+    leds = np.frombuffer(out, dtype=np.uint8).reshape(-1, 4)
+    leds[:, 0] = np.trunc(colors.w[start:end] * 255)
+    h, s, l = colors.h[start:end], colors.s[start:end], colors.l[start:end]
+    table = hsl_table()
+    leds[:, 1:] = hsl_colors(h, s, l) if table is None else table.colors(h, s, l)
+
+# bit per suppression string so a whole frame's suppressions fit in one array
+SUPPRESS_FLAGS = {
+    "flash": 1 << 0,
+    "flicker": 1 << 1,
+    "flitter": 1 << 2,
+    "flux": 1 << 3,
+    "sparkles": 1 << 4,
+    "streamers": 1 << 5,
+}
+
+def suppress_flags(suppress: list[str]) -> int:
+    flags = 0
+    for name in suppress:
+        flags |= SUPPRESS_FLAGS.get(name, 0)
+    return flags
+
+# a whole frame of colors, one array per channel, clamped like Color
+class Colors:
+    def __init__(self, w, h, s, l, suppress):
+        w, h, s, l, suppress = np.broadcast_arrays(w, h, s, l, suppress)
+        self._w = np.clip(w, 0.0, 1.0)
+        self._h = np.mod(h, 1)
+        self._s = np.clip(s, 0.0, 1.0)
+        self._l = np.clip(l, -1.0, 1.0)
+        self.suppress = suppress.astype(np.uint8)
+
+    @classmethod
+    def full(cls,
+             n: int,
+             w: float=0.0,
+             h: float=0.0,
+             s: float=1.0,
+             l: float=-1.0,
+             suppress: list[str] | None=None) -> 'Colors':
+        return cls(
+            np.full(n, w, dtype=float),
+            np.full(n, h, dtype=float),
+            np.full(n, s, dtype=float),
+            np.full(n, l, dtype=float),
+            np.full(n, suppress_flags(suppress or []), dtype=np.uint8),
+        )
+
+    @property
+    def w(self):
+        return self._w
+
+    @w.setter
+    def w(self, v):
+        np.clip(v, 0.0, 1.0, out=self._w)
+
+    @property
+    def h(self):
+        return self._h
+
+    @h.setter
+    def h(self, v):
+        np.mod(v, 1, out=self._h)
+
+    @property
+    def s(self):
+        return self._s
+
+    @s.setter
+    def s(self, v):
+        np.clip(v, 0.0, 1.0, out=self._s)
+
+    @property
+    def l(self):
+        return self._l
+
+    @l.setter
+    def l(self, v):
+        np.clip(v, -1.0, 1.0, out=self._l)
+
+    def clamp(self):
+        self.w = self._w
+        self.h = self._h
+        self.s = self._s
+        self.l = self._l
+
+    def suppressed(self, name: str) -> np.ndarray:
+        return (self.suppress & SUPPRESS_FLAGS[name]) != 0
+
+    def unsuppressed(self, name: str, out: np.ndarray | None=None) -> np.ndarray:
+        return np.equal(self.suppress & SUPPRESS_FLAGS[name], 0, out=out)
+
+    def __len__(self):
+        return len(self._w)
+
+    def __getitem__(self, idx) -> 'Colors':
+        return Colors(self._w[idx], self._h[idx], self._s[idx], self._l[idx], self.suppress[idx])
+
+    def __setitem__(self, idx, colors: 'Colors'):
+        self._w[idx] = colors.w
+        self._h[idx] = colors.h
+        self._s[idx] = colors.s
+        self._l[idx] = colors.l
+        self.suppress[idx] = colors.suppress
+
+    @classmethod
+    def of(cls, colors: list[Color]) -> 'Colors':
+        n = len(colors)
+        return cls(
+            np.fromiter((color.w for color in colors), dtype=float, count=n),
+            np.fromiter((color.h for color in colors), dtype=float, count=n),
+            np.fromiter((color.s for color in colors), dtype=float, count=n),
+            np.fromiter((color.l for color in colors), dtype=float, count=n),
+            np.zeros(n, dtype=np.uint8),
+        )
+
+    def color(self, idx: int) -> Color:
+        return Color(self._w[idx], self._h[idx], self._s[idx], self._l[idx])
+
+    def set_color(self, idx: int, color: Color):
+        self._w[idx] = color.w
+        self._h[idx] = color.h
+        self._s[idx] = color.s
+        self._l[idx] = color.l
+
+    # a copy with the masked colors replaced by plain white
+    def whiten(self, white: np.ndarray) -> 'Colors':
+        return Colors(
+            np.where(white, 1.0, self._w),
+            np.where(white, 0.0, self._h),
+            np.where(white, 0.0, self._s),
+            np.where(white, -0.75, self._l),
+            self.suppress,
+        )
+
+    def __iter__(self):
+        for w, h, s, l in zip(self._w.tolist(), self._h.tolist(), self._s.tolist(), self._l.tolist()):
+            yield Color(w, h, s, l)
+
+    def __repr__(self):
+        return f"Colors({len(self)})"
+
+# moves the wire bytes in `out` `weight` of the way towards `other`
+def mix_frames(out, other, weight: float):
+    curr = np.frombuffer(out, dtype=np.uint8)
+    mixed = np.frombuffer(other, dtype=np.uint8).astype(float)
+    mixed -= curr
+    mixed *= weight
+    mixed += curr
+    curr[:] = np.rint(mixed)
+
+# two frames part way through a cross-fade, mixed per LED in wire bytes
+# rather than in HSL so hues don't swing the long way round the wheel
+class CrossFade:
+    def __init__(self, curr: Colors, next: Colors, weight: float):
+        self.curr = curr
+        self.next = next
+        self.weight = weight
+
+    def __len__(self):
+        return len(self.curr)
+
+    # `scratch` is a bytearray the size of `out` for the incoming frame
+    def encode(self, out: bytearray, start: int=0, scratch: bytearray | None=None):
+        scratch = scratch if scratch is not None else bytearray(len(out))
+        encode(self.curr, out, start)
+        encode(self.next, scratch, start)
+        mix_frames(out, scratch, self.weight)
+
+    def __repr__(self):
+        return f"CrossFade({len(self)}, {self.weight})"
+
 # list[str] are suppression strings - could move to an enum for better type safety
 BaseColorValue: TypeAlias = tuple[Color, list[str]]
 
@@ -90,25 +398,61 @@ class BaseColor:
     def init(self, base_hue):
         self.base_hue = base_hue
 
-    def __call__(self, t: float, blend: float, spread: float, pixel_t: float, pixel_y: float) -> BaseColorValue:
+    # params() resolves everything that only depends on t once per frame
+    def params(self, t: float) -> Any:
+        return (
+            getv(self.color_w, t),
+            getv(self.color_h, t),
+            getv(self.color_s, t),
+            getv(self.color_l, t),
+        )
+
+    def apply(self, params: Any, blend: float, spread: float, pixel_t: float, pixel_y: float) -> BaseColorValue:
+        w, h, s, l = params
         color = Color(
-            w=getv(self.color_w, t),
+            w=w,
             h=(
-                getv(self.color_h, t)
+                h
               + (blend if self.blend else 0)
               + ((spread * pixel_t) if self.spread else 0)
             ),
-            s=getv(self.color_s, t),
-            l=getv(self.color_l, t),
+            s=s,
+            l=l,
         )
         return color, self.suppress
 
+    def batch(self,
+              params: Any,
+              blend: float,
+              spread: float,
+              pixel_t: np.ndarray,
+              pixel_y: np.ndarray,
+              out: Colors | None=None) -> Colors:
+        w, h, s, l = params
+        colors = out if out is not None else Colors.full(len(pixel_t))
+        colors.w = w
+        colors.s = s
+        colors.l = l
+        colors.suppress.fill(suppress_flags(self.suppress))
+        h = h + (blend if self.blend else 0)
+        if self.spread:
+            colors.h = np.multiply(pixel_t, spread, out=colors.h) + h
+        else:
+            colors.h = h
+        return colors
+
+    def __call__(self, t: float, blend: float, spread: float, pixel_t: float, pixel_y: float) -> BaseColorValue:
+        return self.apply(self.params(t), blend, spread, pixel_t, pixel_y)
+
     def __repr__(self):
         return f"{self.__class__.__name__}({self.color_w},{self.color_h},{self.color_s},{self.color_l})"
 
 BaseColorFuncs: TypeAlias = list[BaseColor]
 BaseColorFuncsParam: TypeAlias = Callable[[float], BaseColorFuncs] | BaseColorFuncs
 
+def _funcs_params(funcs: list[BaseColor | None], t: float) -> list[Any]:
+    return [None if func is None else func.params(t) for func in funcs]
+
 class WindowColor(BaseColor):
     def __init__(self,
                  ratio: Param,
@@ -117,10 +461,9 @@ class WindowColor(BaseColor):
         super(WindowColor, self).__init__(suppress=suppress)
         self.ratio = ratio
         self.funcs = funcs
-        
-    def __call__(self, t: float, blend: float, spread: float, pixel_t: float, pixel_y: float) -> BaseColorValue:
+
+    def params(self, t: float) -> Any:
         ratio = getv(self.ratio, t)
-        side = int(pixel_t + ratio) % 2
         iteration = 0
         if isinstance(self.ratio, Curve):
             iteration = int(t / self.ratio.length)
@@ -129,13 +472,45 @@ class WindowColor(BaseColor):
             funcs = getv_funcs(self.funcs, t)
         else:
             funcs = [None, None]
+        return ratio, iteration, funcs, _funcs_params(funcs, t)
 
+    def apply(self, params: Any, blend: float, spread: float, pixel_t: float, pixel_y: float) -> BaseColorValue:
+        ratio, iteration, funcs, funcs_params = params
+        side = int(pixel_t + ratio) % 2
         func = funcs[side]
         if func is None:
             color = Color(0, blend + ((side + iteration) * spread), 1, 0)
             return color, self.suppress
         else:
-            return func(t, blend, spread, pixel_t, pixel_y)
+            return func.apply(funcs_params[side], blend, spread, pixel_t, pixel_y)
+
+    def batch(self,
+              params: Any,
+              blend: float,
+              spread: float,
+              pixel_t: np.ndarray,
+              pixel_y: np.ndarray,
+              out: Colors | None=None) -> Colors:
+        ratio, iteration, funcs, funcs_params = params
+        sides = np.trunc(pixel_t + ratio).astype(np.int64) % 2
+
+        colors = out if out is not None else Colors.full(len(pixel_t))
+        for side in np.unique(sides).tolist():
+            mask = sides == side
+            func = funcs[side]
+            if func is None:
+                side_colors = Colors.full(
+                    np.count_nonzero(mask),
+                    h=blend + ((side + iteration) * spread),
+                    l=0,
+                    suppress=self.suppress,
+                )
+                colors[mask] = side_colors
+            elif mask.all():
+                func.batch(funcs_params[side], blend, spread, pixel_t, pixel_y, out=colors)
+            else:
+                colors[mask] = func.batch(funcs_params[side], blend, spread, pixel_t[mask], pixel_y[mask])
+        return colors
 
     def __repr__(self):
         return f"Window({self.ratio}, {self.funcs})"
@@ -153,12 +528,32 @@ class SplitColor(BaseColor):
             [BaseColor(l=0), BaseColor()]
         )
 
-    def __call__(self, t: float, blend: float, spread: float, pixel_t: float, pixel_y: float) -> BaseColorValue:
-        count = getv(self.count, t)
-        side = int((pixel_t % 1) * count)
+    def params(self, t: float) -> Any:
         funcs = getv_funcs(self.funcs, t)
-        func = funcs[side]
-        return func(t, blend, spread, pixel_t, pixel_y)
+        return getv(self.count, t), funcs, _funcs_params(funcs, t)
+
+    def apply(self, params: Any, blend: float, spread: float, pixel_t: float, pixel_y: float) -> BaseColorValue:
+        count, funcs, funcs_params = params
+        side = int((pixel_t % 1) * count)
+        return funcs[side].apply(funcs_params[side], blend, spread, pixel_t, pixel_y)
+
+    def batch(self,
+              params: Any,
+              blend: float,
+              spread: float,
+              pixel_t: np.ndarray,
+              pixel_y: np.ndarray,
+              out: Colors | None=None) -> Colors:
+        count, funcs, funcs_params = params
+        sides = np.trunc((pixel_t % 1) * count).astype(np.int64)
+        colors = out if out is not None else Colors.full(len(pixel_t))
+        for side in np.unique(sides).tolist():
+            mask = sides == side
+            if mask.all():
+                funcs[side].batch(funcs_params[side], blend, spread, pixel_t, pixel_y, out=colors)
+            else:
+                colors[mask] = funcs[side].batch(funcs_params[side], blend, spread, pixel_t[mask], pixel_y[mask])
+        return colors
 
     def __repr__(self):
         return f"Split({self.count}, {self.funcs})"
@@ -188,14 +583,18 @@ class FallingColor(BaseColor):
     def ycurve(self) -> Curve:
         return Curve(linear, [(0, 0), (self._period, self._num_colors)])
 
-    def __call__(self, t: float, blend: float, spread: float, pixel_t: float, pixel_y: float) -> BaseColorValue:
+    def params(self, t: float) -> Any:
         s = (t + self._offset) % 60
-        pixel_y += getv(self.ycurve, s)
+        return getv(self.ycurve, s), getv(self._skip, t), getv(self._hue_func, t)
+
+    def apply(self, params: Any, blend: float, spread: float, pixel_t: float, pixel_y: float) -> BaseColorValue:
+        fall, skip, hue = params
+        pixel_y += fall
         l = getv(self._fade_func, pixel_y)
         l = ((l + 1) ** 2) - 1
-        h = int(pixel_y) * getv(self._skip, t)
+        h = int(pixel_y) * skip
         h += blend
-        h += getv(self._hue_func, t)
+        h += hue
 
         return Color(
             w=0,
@@ -204,6 +603,29 @@ class FallingColor(BaseColor):
             l=l,
         ), self.suppress
 
+    def batch(self,
+              params: Any,
+              blend: float,
+              spread: float,
+              pixel_t: np.ndarray,
+              pixel_y: np.ndarray,
+              out: Colors | None=None) -> Colors:
+        fall, skip, hue = params
+        pixel_y = pixel_y + fall
+        l = getv(self._fade_func, pixel_y)
+        l = ((l + 1) ** 2) - 1
+        h = np.trunc(pixel_y) * skip
+        h += blend
+        h += hue
+
+        colors = out if out is not None else Colors.full(len(pixel_t))
+        colors.w = 0
+        colors.h = h
+        colors.s = 1
+        colors.l = l
+        colors.suppress.fill(suppress_flags(self.suppress))
+        return colors
+
 def setcolor(w: float | None=None,
              h: float | None=None,
              s: float | None=None,
@@ -10,10 +10,10 @@ from pytweening import (
     easeOutQuad,
     easeInOutQuad,
 )
-import random
 from typing import Callable
 from colors import (
     Color,
+    Colors,
     ColorFuncs,
     BaseColor,
     SplitColor,
@@ -45,7 +45,7 @@ from topologies import (
     MirrorTopology,
     RepeatTopology,
 )
-from utils import (mk_bounce, mk_bump)
+from utils import (mk_bounce, mk_bump, rands, source)
 
 class Option:
     def __init__(self, name: str, value):
@@ -106,7 +106,7 @@ class Control:
         self.set(self.selected_idx + step)
 
     def randomize(self):
-        idx = random.randint(0, len(self.options) - 1)
+        idx = source.random.randint(0, len(self.options) - 1)
         self.set(idx)
 
     @property
@@ -259,68 +259,83 @@ class FluxFeature(BounceFeature):
     def __init__(self, max_v: float=1):
         super(FluxFeature, self).__init__("Flux", "flux", max_v)
 
-class SparklesFeature(Feature):
-    def _mk_sparkle(self,
-                    w: float | None=None,
-                    h: float | None=None,
-                    s: float | None=None,
-                    l: float | None=None,
-                    make_white: bool=False):
-        def func(color: Color) -> Color:
-            if color.l != -1.0 and make_white:
-                return Color(w=1, s=0.0, l=-0.75)
-            return Color(
-                w=w if w is not None else color.w,
-                h=h if h is not None else color.h,
-                s=s if s is not None else color.s,
-                l=l if l is not None else color.l,
-            )
-        return func
-
-    def random_sparkle(self, color: Color) -> Color:
+# sparkle effects work on a single Color or, through batch(), on every
+# sparkled pixel of a frame at once
+class SparkleFunc:
+    def __init__(self,
+                 w: float | None=None,
+                 h: float | None=None,
+                 s: float | None=None,
+                 l: float | None=None,
+                 make_white: bool=False):
+        self.w = w
+        self.h = h
+        self.s = s
+        self.l = l
+        self.make_white = make_white
+
+    def __call__(self, color: Color) -> Color:
+        if color.l != -1.0 and self.make_white:
+            return Color(w=1, s=0.0, l=-0.75)
         return Color(
-            w=color.w,
-            h=color.h + rand(-0.5, 0.5)(0),
-            s=color.s,
-            l=color.l,
+            w=self.w if self.w is not None else color.w,
+            h=self.h if self.h is not None else color.h,
+            s=self.s if self.s is not None else color.s,
+            l=self.l if self.l is not None else color.l,
         )
 
-    def rainbow_sparkle(self, color: Color) -> Color:
-        if self.rainbow is None:
-            return color
-        return Color(
-            w=color.w,
-            h=color.h + rand(-self.rainbow.value / 2, self.rainbow.value / 2)(0),
-            s=color.s,
-            l=color.l,
+    def batch(self, colors: Colors) -> Colors:
+        sparkled = Colors(
+            self.w if self.w is not None else colors.w,
+            self.h if self.h is not None else colors.h,
+            self.s if self.s is not None else colors.s,
+            self.l if self.l is not None else colors.l,
+            colors.suppress,
         )
+        if self.make_white:
+            return sparkled.whiten(colors.l != -1.0)
+        return sparkled
+
+class JitterSparkle:
+    def __init__(self, width: Callable[[], float]):
+        self.width = width
 
-    def flux_sparkle(self, color: Color) -> Color:
-        if self.flux is None:
-            return color
+    def __call__(self, color: Color) -> Color:
+        width = self.width()
         return Color(
             w=color.w,
-            h=color.h + rand(-self.flux._value.value / 2, self.flux._value.value / 2)(0),
+            h=color.h + rand(-width / 2, width / 2)(0),
             s=color.s,
             l=color.l,
         )
 
+    def batch(self, colors: Colors) -> Colors:
+        width = self.width()
+        return Colors(
+            colors.w,
+            colors.h + rands(-width / 2, width / 2)(len(colors)),
+            colors.s,
+            colors.l,
+            colors.suppress,
+        )
+
+class SparklesFeature(Feature):
     def __init__(self, rainbow: Control | None=None, flux: FluxFeature | None=None):
         self.rainbow = rainbow
         self.flux = flux
         effects = [
-            ("base", self._mk_sparkle(l=0)),
-            ("base_whiten", self._mk_sparkle(l=0, make_white=True)),
-            ("blank", self._mk_sparkle(l=-1)),
-            ("invert", self._mk_sparkle(h=0.5, l=0)),
-            ("invert_whiten", self._mk_sparkle(h=0.5, l=0, make_white=True)),
-            ("whiten", self._mk_sparkle(w=1, s=0, l=-0.75)),
-            ("random", self.random_sparkle),
+            ("base", SparkleFunc(l=0)),
+            ("base_whiten", SparkleFunc(l=0, make_white=True)),
+            ("blank", SparkleFunc(l=-1)),
+            ("invert", SparkleFunc(h=0.5, l=0)),
+            ("invert_whiten", SparkleFunc(h=0.5, l=0, make_white=True)),
+            ("whiten", SparkleFunc(w=1, s=0, l=-0.75)),
+            ("random", JitterSparkle(lambda: 1.0)),
         ]
         if self.rainbow is not None:
-            effects.append(("Rainbow", self.rainbow_sparkle))
+            effects.append(("Rainbow", JitterSparkle(lambda: self.rainbow.value)))
         if self.flux is not None:
-            effects.append(("Flux", self.flux_sparkle))
+            effects.append(("Flux", JitterSparkle(lambda: self.flux._value.value)))
 
         self._enabled = ToggleControl("Enabled")
         self._curved = ToggleControl("Curved")
@@ -1,83 +1,269 @@
-import io
-import math
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from pytweening import linear, easeInOutCubic
 import random
+import socket
+from threading import Event, Thread
 import time
-from xled.discover import xdiscover
-from xled.control import ControlInterface
-
-from colors import Color
+import traceback
+from contextlib import nullcontext
+from typing import Any, Callable
+from requests.adapters import HTTPAdapter
+from tornado.ioloop import IOLoop
+from xled.discover import DiscoveryInterface
+from xled.control import REALTIME_UDP_PORT_NUMBER, ControlInterface
+
+from colors import Color, Colors, CrossFade, encode, mix_frames
 from control import WiredPattern
 from param import getv, Curve
-from streamer import Streamer, getv_streamers
-from utils import rand
-
-import sys
-sys.stdout = open('log.txt', 'w')
-sys.stderr = open('error.txt', 'w')
-
-class Pixel:
-    def __init__(self, strand, idx, x, y, z):
-        self._y = y
-        self.y = self._y
-        self._t = ((math.atan2(z, x) / math.pi) + 1) / 2
-        self.t = self._t
-        self.strand = strand
-        self.idx = idx
-        self.color = Color()
-
-    def reset(self):
-        self.t = self._t
-        self.y = self._y
-        self.color.reset()
-
-    @property
-    def w(self):
-        return self.color.w
-
-    @w.setter
-    def w(self, w):
-        self.color.w = max(0.0, min(1.0, w))
- 
-    @property
-    def h(self):
-        return self.color.h
-
-    @h.setter
-    def h(self, h):
-        self.color.h = h % 1
- 
-    @property
-    def s(self):
-        return self.color.s
-
-    @s.setter
-    def s(self, s):
-        self.color.s = max(0.0, min(1.0, s))
- 
-    @property
-    def l(self):
-        return self.color.l
-
-    @l.setter
-    def l(self, l):
-        self.color.l = max(-1.0, min(1.0, l))
- 
-    def as_byte(self, t=0):
-        return self.color.as_byte(t)
-
+from layoutcache import LayoutCache
+from lookahead import Lookahead
+from pipeline import LatencyCounter, Pipeline
+from playback import FramePlayer
+from realtime import FrameDiff, RealtimeSender, fragments, rt_header
+from scheduler import CatchUp, FrameScheduler
+from streamer import Streamer, StreamerBand, getv_streamers
+from timing import StageTimers
+from utils import rand, source
+
+# `geometry` is what geometry() returned for the same layouts, to skip
+# working it out again
+class PixelField:
+    def __init__(self, layouts: list[list[dict]], geometry: dict[str, np.ndarray] | None=None):
+        size = sum(len(layout) for layout in layouts)
+        if geometry is not None:
+            self.y = geometry["y"]
+            self.t = geometry["t"]
+            self.y_order = geometry["y_order"]
+        else:
+            coordinates = [p for layout in layouts for p in layout]
+            x = np.fromiter((p['x'] for p in coordinates), dtype=float, count=size)
+            z = np.fromiter((p['z'] for p in coordinates), dtype=float, count=size)
+            self.y = np.fromiter((p['y'] for p in coordinates), dtype=float, count=size)
+            self.t = ((np.arctan2(z, x) / np.pi) + 1) / 2
+            # pixels sorted by height, so a streamer band only visits the
+            # pixels between its ends instead of the whole tree
+            self.y_order = np.argsort(self.y, kind='stable')
+        self.sorted_y = self.y[self.y_order]
+        self.strand = np.repeat(
+            np.arange(len(layouts), dtype=np.int32),
+            [len(layout) for layout in layouts],
+        )
+        self.idx = np.concatenate([
+            np.arange(len(layout), dtype=np.int32) for layout in layouts
+        ])
+
+        # scratch space reused by every frame so rendering doesn't allocate
+        self.pixel_t = np.empty(size)
+        self.scratch = np.empty(size)
+        self.mask = np.empty(size, dtype=bool)
+        self.colors = Colors.full(size)
+        self.next_colors = Colors.full(size)
+
+    def __len__(self):
+        return len(self.t)
+
+    def geometry(self) -> dict[str, np.ndarray]:
+        return {"y": self.y, "t": self.t, "y_order": self.y_order}
+
+    def covered(self, band: StreamerBand) -> np.ndarray:
+        lo = np.searchsorted(self.sorted_y, band.miny, side='left')
+        hi = np.searchsorted(self.sorted_y, band.maxy, side='right')
+        idx = self.y_order[lo:hi]
+        idx = idx[band.select(self.t[idx], self.y[idx])]
+        idx.sort()
+        return idx
+
+# every pattern param that only depends on t, resolved once per frame and
+# shared by all pixels instead of re-evaluating the curves for each one
+class FrameContext:
+    def __init__(self, t: float, pattern: WiredPattern, blend_h: float):
+        self.t = t
+        self.blend = blend_h
+        self.spread = getv(pattern.spread, t)
+        self.spin = getv(pattern.spin, t)
+        self.spiral = getv(pattern.spiral, t)
+        self.flash = getv(pattern.flash, t)
+        self.flicker = getv(pattern.flicker, t)
+        self.flitter = getv(pattern.flitter, t)
+        self.flux = getv(pattern.flux, t)
+        self.topologies = [(topology, topology.params(t)) for topology in pattern.topologies]
+        self.base_color = pattern.base_color.params(t)
+
+# xled never passes a timeout, so an address nothing answers on would hold
+# up bring-up for as long as the OS takes to give up on it
+class _TimeoutAdapter(HTTPAdapter):
+    def __init__(self, timeout: float):
+        super(_TimeoutAdapter, self).__init__()
+        self.timeout = timeout
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super(_TimeoutAdapter, self).send(request, **kwargs)
+
+# runs func on every item at once, handing back its result or the exception
+# it raised for each one, in order
+def _concurrently(func: Callable[[Any], Any], items: list) -> list:
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=len(items)) as pool:
+        futures = [pool.submit(func, item) for item in items]
+    return [future.exception() or future.result() for future in futures]
+
+# with a cache, the layout is only fetched when the firmware version or LED
+# count the device reports no longer match the cached one
 class Interface(ControlInterface):
-    def __init__(self, device):
-        super(Interface, self).__init__(device.ip_address)
-        self.device = device
-        self.layout = self.get_led_layout()['coordinates']
-
+    def __init__(self,
+                 host: str,
+                 id: str | None=None,
+                 cache: LayoutCache | None=None,
+                 timeout: float=5.0):
+        super(Interface, self).__init__(host)
+        self.session.mount("http://", _TimeoutAdapter(timeout))
+        info = self.get_device_info() if id is None or cache is not None else None
+        self.id = id if id is not None else info['device_name']
+        self.checksum = None
+        if cache is None:
+            self.layout = self.get_led_layout()['coordinates']
+            return
+
+        firmware = self.firmware_version()['version']
+        cached = cache.layout(self.id, firmware, info['number_of_led'])
+        if cached is not None:
+            self.layout, self.checksum = cached
+        else:
+            self.layout = self.get_led_layout()['coordinates']
+            self.checksum = cache.put_layout(self.id, firmware, self.layout)
+
+# the controllers at `hosts`, or failing that the ones the cache last
+# reached, or failing that every controller that answers discovery within
+# `timeout` (or the first `count` of them). Every device logs in and fetches
+# its layout at the same time. Each one drives as many LEDs as its layout
+# has, and the frame is laid out controller after controller in device id
+# order
 class Lights:
-    def __init__(self):
-        dgen = xdiscover()
-        devices = [next(dgen), next(dgen)]
-        self.interfaces = [Interface(device) for device in devices]
-        self.udpclient = self.interfaces[0].udpclient
+    def __init__(self,
+                 count: int | None=None,
+                 timeout: float=5.0,
+                 hosts: list[str] | None=None,
+                 cache: LayoutCache | None=None):
+        self.started = time.perf_counter()
+        self.timeout = timeout
+        self.cache = cache
+        interfaces = []
+        if hosts:
+            interfaces = self._connect(hosts)
+            if len(interfaces) < len(hosts):
+                raise RuntimeError(f"Reached {len(interfaces)} of the {len(hosts)} devices asked for")
+            origin = "configured addresses"
+        elif cache is not None and cache.hosts:
+            interfaces = self._connect(cache.hosts)
+            origin = "cached addresses"
+            # someone's moved or been taken away, or there are fewer than
+            # `count`. A controller added since isn't noticed while all the
+            # cached ones still answer, that takes `count` or a fresh cache
+            if len(interfaces) < len(cache.hosts) or (count is not None and len(interfaces) < count):
+                print("Cached addresses are out of date, discovering", flush=True)
+                interfaces = []
+        if not interfaces:
+            interfaces = self._discover(count)
+            origin = "discovery"
+
+        self.interfaces = sorted(interfaces, key=lambda interface: interface.id)
+        if cache is not None:
+            cache.put_hosts([interface.host for interface in self.interfaces])
+            cache.save()
+        # frames only go out, so send from any free port instead of binding
+        # xled's 7777, which a local emulator may already be listening on
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.counts = [len(interface.layout) for interface in self.interfaces]
+        self.offsets = [sum(self.counts[:i]) for i in range(len(self.counts))]
+        print(
+            f"Found {len(self.interfaces)} devices with {sum(self.counts)} LEDs: {self.counts}",
+            f"from {origin} in {time.perf_counter() - self.started:.2f}s",
+            flush=True,
+        )
+
+    def _connect(self, hosts: list[str], ids: list[str] | None=None) -> list[Interface]:
+        ids = ids if ids is not None else [None] * len(hosts)
+        results = _concurrently(
+            lambda device: Interface(device[0], device[1], self.cache, self.timeout),
+            list(zip(hosts, ids)),
+        )
+        interfaces = []
+        for host, result in zip(hosts, results):
+            if isinstance(result, Exception):
+                print(f"Couldn't reach {host}: {result}", flush=True)
+            else:
+                interfaces.append(result)
+        return interfaces
+
+    # seconds between checks for being told to stop listening
+    discover_poll = 0.1
+
+    def _discover(self, count: int | None) -> list[Interface]:
+        devices = {}
+        stop = Event()
+
+        # xdiscover can block well past its own timeout when nothing answers,
+        # so poll xled's discovery directly. Leaving the with block stops its
+        # agent and closes the discovery socket, but not the event loops it
+        # made for this thread and its agent's
+        def listen():
+            discovery = DiscoveryInterface()
+            with discovery:
+                while not stop.is_set():
+                    if not discovery.pipe.poll(self.discover_poll * 1000):
+                        continue
+                    event, *response = discovery.recv()
+                    if event == b"JOINED":
+                        _, id, ip_address = (part.decode() for part in response)
+                        devices[id] = ip_address
+                        if count is not None and len(devices) >= count:
+                            break
+                    elif event == b"ERROR":
+                        print(f"Discovery failed: {response}", flush=True)
+                        break
+            discovery.agent.loop.close()
+            IOLoop.current().close()
+
+        listener = Thread(target=listen, daemon=True)
+        listener.start()
+        listener.join(self.timeout)
+        stop.set()
+        listener.join()
+        interfaces = self._connect(list(devices.values()), list(devices))
+        if not interfaces or (count is not None and len(interfaces) < count):
+            raise RuntimeError(f"Found {len(interfaces)} devices, wanted {count or 'at least 1'}")
+        return interfaces
+
+    def set_mode(self, mode: str):
+        for result in _concurrently(lambda interface: interface.set_mode(mode), self.interfaces):
+            if isinstance(result, Exception):
+                raise result
+
+# stands in for a controller whose layout is already known, so a Blender
+# can render without any devices on the network
+class OfflineInterface:
+    def __init__(self, layout: list[dict], host: str | None=None):
+        self.layout = layout
+        self.host = host
+
+    def set_mode(self, mode: str):
+        pass
+
+class OfflineLights:
+    def __init__(self, layouts: list[list[dict]]):
+        self.started = time.perf_counter()
+        self.cache = None
+        self.interfaces = [OfflineInterface(layout) for layout in layouts]
+        self.socket = None
+        self.counts = [len(layout) for layout in layouts]
+        self.offsets = [sum(self.counts[:i]) for i in range(len(self.counts))]
+
+    def set_mode(self, mode: str):
+        pass
 
 class Blender:
     sparkle_delay = 0.25
@@ -89,22 +275,63 @@ class Blender:
     def __init__(self,
                  patterns: list[WiredPattern],
                  start_idx: int | None=None,
-                 pause_change: bool=False):
-        self.lights = Lights()
+                 pause_change: bool=False,
+                 vectorized: bool=True,
+                 rgb_fade: bool=False,
+                 fps: float=16,
+                 catch_up: CatchUp=CatchUp.SKIP,
+                 pipelined: bool=False,
+                 lookahead: int=0,
+                 lights: Lights | None=None,
+                 async_send: bool=False,
+                 skip_unchanged: bool=False,
+                 player: FramePlayer | None=None):
+        if lookahead and (pipelined or async_send):
+            raise ValueError("Lookahead workers are forked, so they can't run alongside the pipeline or async sender threads")
+        self.lights = lights if lights is not None else Lights()
         self.patterns = patterns
         self.start_idx = start_idx
         self.pause_change = pause_change
+        self.vectorized = vectorized
+        self.rgb_fade = rgb_fade
+        self.scheduler = FrameScheduler(fps, catch_up)
         self._blend_func = Curve(linear, [(0, 0), (66, 1)])
-        self.buffers = [io.BytesIO() for _ in self.lights.interfaces]
-        self.light_pixels = [
-            [Pixel(strand, idx, **p) for idx, p in enumerate(interface.layout)]
-            for strand, interface in enumerate(self.lights.interfaces)
-        ]
+        self._fade_func = Curve(easeInOutCubic, [(0, 0), (self.transition_length, 1)])
+        self.frames = [bytearray(4 * len(interface.layout)) for interface in self.lights.interfaces]
+        self.fade_frames = [bytearray(len(frame)) for frame in self.frames]
+        self.field = self._field()
+        self.rng = np.random.default_rng()
+        # the generators seed_tick started, None to draw from the random modules
+        self.tick_random = None
+        self.tick_np_random = None
+        self.timers = StageTimers()
+        self.pipeline = Pipeline(self) if pipelined else None
+        self.lookahead = Lookahead(self, lookahead) if lookahead else None
+        self.sender = RealtimeSender(self.lights.interfaces, skip_unchanged) if async_send else None
+        self.diffs = (
+            [FrameDiff() for _ in self.lights.interfaces]
+            if skip_unchanged and not async_send else
+            None
+        )
+        # the realtime header each device's changed fragments go behind when
+        # sending from this thread, and the token it was built from
+        self.rt_headers = [(None, b"") for _ in self.lights.interfaces]
+        # per device send times and failures when sending from this thread
+        self.send_latency = [LatencyCounter(interface.host) for interface in self.lights.interfaces]
+        self.send_errors = [0 for _ in self.lights.interfaces]
+        # seconds from the lights starting to come up to the first frame sent
+        self.first_frame = None
+        self.player = player
+        # 1 while playing (or fading into) the player's frames, -1 while
+        # fading back out to the live patterns, 0 when live
+        self.playback = 0
+        self.playback_start = 0.0
+        self.playback_fade_start = 0.0
         self.running = False
         self.pattern = self.patterns[
             start_idx
             if start_idx is not None else
-            random.randint(0, len(patterns) - 1)
+            source.random.randint(0, len(patterns) - 1)
         ]
         self.next_pattern = self._pick_next()
         self.transitioning = False
@@ -112,23 +339,32 @@ class Blender:
         self._t = 0.0
         self.pattern_end = self.pattern_length
 
-    @property
-    def pixels(self) -> list[Pixel]:
-        return self.light_pixels[0] + self.light_pixels[1]
+    def _field(self) -> PixelField:
+        layouts = [interface.layout for interface in self.lights.interfaces]
+        cache = self.lights.cache
+        if cache is None:
+            return PixelField(layouts)
+        checksums = [interface.checksum for interface in self.lights.interfaces]
+        geometry = cache.field(checksums)
+        field = PixelField(layouts, geometry)
+        if geometry is None:
+            cache.put_field(checksums, field.geometry())
+            cache.save()
+        return field
 
     def _pick_next(self) -> WiredPattern:
-        choice = random.choice([p for p in self.patterns if p.name != self.pattern.name])
+        others = [p for p in self.patterns if p.name != self.pattern.name]
+        choice = source.random.choice(others or self.patterns)
         choice.randomize()
         return choice
 
     def init(self, t: float):
-        for interface in self.lights.interfaces:
-            interface.set_mode("rt")
-    
+        self.lights.set_mode("rt")
+
         if self.start_idx is not None:
             self.pattern = self.patterns[self.start_idx]
         else:
-            self.pattern = random.choice(self.patterns)
+            self.pattern = source.random.choice(self.patterns)
         self.next_pattern = self._pick_next()
         self.pattern.base_color.init(getv(self._blend_func, t))
         self.pattern.randomize()
@@ -139,79 +375,221 @@ class Blender:
         self.pattern_start = t
         self.pattern_end = t + self.pattern_length
         self.next_sparkle = t
-        self.sparkles = []
+        self.sparkles = np.zeros(len(self.field), dtype=bool)
         self.next_streamer = t
         self.streamers = []
         self.running = True
+        if self.pipeline is not None:
+            self.pipeline.start()
 
-    def _render(self, t: float, pattern: WiredPattern) -> list[Color]:
-        blend_h = getv(self._blend_func, t)
-        spread_h = getv(pattern.spread, t)
-        flash_v = getv(pattern.flash, t)
-        flash_func = rand(0.0, flash_v)
-        flicker_v = getv(pattern.flicker, t)
-        flicker_func = rand(0.0, flicker_v)
-        flitter_v = getv(pattern.flitter, t)
-        flitter_func = rand(0.0, flitter_v)
-        flux_v = getv(pattern.flux, t)
-        flux_func = rand(-flux_v/2, flux_v/2)
+    def stop(self):
+        self.running = False
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        if self.lookahead is not None:
+            self.lookahead.close()
+        if self.sender is not None:
+            self.sender.close()
+        if self.player is not None:
+            self.player.close()
+
+    # changes from outside the frame loop (Menu commands) go through here so
+    # frames rendered ahead with the old settings get thrown away
+    def apply(self, command: Callable[['Blender'], None]):
+        if self.lookahead is not None:
+            self.lookahead.invalidate()
+        command(self)
+
+    # every random source restarted from (seed, tick), so processes that
+    # step through the same ticks make the same random choices. The
+    # generators are the blender's own and only stand in for the random
+    # modules while it steps and draws, so the rest of the process (the Menu
+    # randomizing a pattern) keeps its own randomness
+    def seed_tick(self, seed: int, tick: int):
+        self.tick_random = random.Random(f"{seed}:{tick}")
+        self.tick_np_random = np.random.RandomState([seed, tick])
+        self.rng = np.random.default_rng([seed, tick])
+
+    def _randomness(self):
+        if self.tick_random is None:
+            return nullcontext()
+        return source.using(self.tick_random, self.tick_np_random)
 
+    def _render(self, t: float, pattern: WiredPattern) -> list[Color]:
+        timers = self.timers
+        start = time.perf_counter()
+        ctx = FrameContext(t, pattern, getv(self._blend_func, t))
+        flash_func = rand(0.0, ctx.flash)
+        flicker_func = rand(0.0, ctx.flicker)
+        flitter_func = rand(0.0, ctx.flitter)
+        flux_func = rand(-ctx.flux/2, ctx.flux/2)
+
+        start = timers.lap("params", start)
+        sparkles = self.sparkles.tolist()
+        streamed = self._streamed()
+        start = timers.lap("streamers", start)
         colors = []
-        for pixel in self.pixels:
-            pixel_t = (
-                pixel.t
-              + getv(pattern.spin, t)
-              + (getv(pattern.spiral, t) * pixel.y)
-            ) % 1
-
-            for topology in pattern.topologies:
-                pixel_t = topology(t, pixel_t, pixel.y)
-
-            color, suppress = pattern.base_color(
-                t,
-                blend_h,
-                spread_h,
+        field = self.field
+        for idx, (angle, height) in enumerate(zip(field.t.tolist(), field.y.tolist())):
+            pixel_t = (angle + ctx.spin + (ctx.spiral * height)) % 1
+
+            for topology, params in ctx.topologies:
+                pixel_t = topology.apply(params, pixel_t, height)
+
+            color, suppress = pattern.base_color.apply(
+                ctx.base_color,
+                ctx.blend,
+                ctx.spread,
                 pixel_t,
-                pixel.y,
+                height,
             )
 
-            if "flash" not in suppress and pixel.l != -1.0:
+            if "flash" not in suppress and color.l != -1.0:
                 color.l -= flash_func()
             if "flicker" not in suppress:
                 color.w += flicker_func()
-            if "flitter" not in suppress and pixel.s != 0.0:
+            if "flitter" not in suppress and color.s != 0.0:
                 color.s -= flitter_func()
             if "flux" not in suppress:
                 color.h += flux_func()
 
             if "sparkles" not in suppress:
-                idx = pixel.idx + (400 * pixel.strand)
-                if idx in self.sparkles:
+                if sparkles[idx]:
                     color = self.pattern.sparkle_func(color)
 
             if "streamers" not in suppress:
-                for streamer in self.streamers:
-                    if streamer.contains(self._t, pixel):
-                        color = streamer.func(color, t, blend_h)
+                for streamer in streamed.get(idx, ()):
+                    color = streamer.func(color, t, ctx.blend)
 
             colors.append(color)
 
+        # every stage happens pixel by pixel, so they're only timed together
+        timers.lap("pixels", start)
         return colors
 
-    def _render_transition(self, t: float) -> list[Color]:
+    # pixel index -> the live streamers covering it, in streamer order
+    def _streamed(self) -> dict[int, list[Streamer]]:
+        streamed = {}
+        for streamer in self.streamers:
+            band = streamer.band(self._t)
+            if band is not None:
+                for idx in self.field.covered(band).tolist():
+                    streamed.setdefault(idx, []).append(streamer)
+        return streamed
+
+    def _noise(self, minv: float, maxv: float) -> np.ndarray:
+        s = self.rng.random(out=self.field.scratch)
+        s *= (maxv - minv)
+        s += minv
+        return s
+
+    def _render_batch(self, t: float, pattern: WiredPattern, colors: Colors) -> Colors:
+        field = self.field
+        timers = self.timers
+        start = time.perf_counter()
+        ctx = FrameContext(t, pattern, getv(self._blend_func, t))
+        start = timers.lap("params", start)
+
+        pixel_t = np.add(field.t, ctx.spin, out=field.pixel_t)
+        pixel_t += np.multiply(field.y, ctx.spiral, out=field.scratch)
+        pixel_t %= 1
+
+        for topology, params in ctx.topologies:
+            pixel_t = topology.batch(params, pixel_t, field.y)
+        start = timers.lap("topology", start)
+
+        colors = pattern.base_color.batch(ctx.base_color, ctx.blend, ctx.spread, pixel_t, field.y, out=colors)
+        start = timers.lap("base", start)
+
+        # a zero effect leaves every channel untouched, so skip drawing for it
+        mask = field.mask
+        if ctx.flash:
+            colors.unsuppressed("flash", out=mask)
+            mask &= colors.l != -1.0
+            np.subtract(colors.l, self._noise(0.0, ctx.flash), out=colors.l, where=mask)
+        if ctx.flicker:
+            colors.unsuppressed("flicker", out=mask)
+            np.add(colors.w, self._noise(0.0, ctx.flicker), out=colors.w, where=mask)
+        if ctx.flitter:
+            colors.unsuppressed("flitter", out=mask)
+            mask &= colors.s != 0.0
+            np.subtract(colors.s, self._noise(0.0, ctx.flitter), out=colors.s, where=mask)
+        if ctx.flux:
+            colors.unsuppressed("flux", out=mask)
+            np.add(colors.h, self._noise(-ctx.flux/2, ctx.flux/2), out=colors.h, where=mask)
+        colors.clamp()
+        start = timers.lap("effects", start)
+
+        sparkled = np.logical_and(self.sparkles, ~colors.suppressed("sparkles"), out=mask)
+        if sparkled.any():
+            sparkle_func = self.pattern.sparkle_func
+            if hasattr(sparkle_func, "batch"):
+                colors[sparkled] = sparkle_func.batch(colors[sparkled])
+            else:
+                for idx in np.flatnonzero(sparkled).tolist():
+                    colors.set_color(idx, sparkle_func(colors.color(idx)))
+        start = timers.lap("sparkles", start)
+
+        if self.streamers:
+            suppressed = colors.suppressed("streamers")
+            for streamer in self.streamers:
+                band = streamer.band(self._t)
+                if band is None:
+                    continue
+                idx = field.covered(band)
+                idx = idx[~suppressed[idx]]
+                if len(idx):
+                    colors[idx] = streamer.func.batch(colors[idx], t, ctx.blend)
+        timers.lap("streamers", start)
+
+        return colors
+
+    # the easing weight is the same for every pixel, so work it out once and
+    # mix the two frames channel by channel
+    def _render_transition(self, t: float) -> list[Color] | CrossFade:
+        weight = getv(self._fade_func, t)
         curr_colors = self._render(t, self.pattern)
         next_colors = self._render(self.transition_offset + t, self.next_pattern)
+        start = time.perf_counter()
+        if self.rgb_fade:
+            colors = CrossFade(Colors.of(curr_colors), Colors.of(next_colors), weight)
+            self.timers.lap("blend", start)
+            return colors
+
         colors = []
         for curr_color, next_color in zip(curr_colors, next_colors):
             colors.append(Color(
-                getv(Curve(easeInOutCubic, [(0, curr_color.w), (6, next_color.w)]), t),
-                getv(Curve(easeInOutCubic, [(0, curr_color.h), (6, next_color.h)]), t),
-                getv(Curve(easeInOutCubic, [(0, curr_color.s), (6, next_color.s)]), t),
-                getv(Curve(easeInOutCubic, [(0, curr_color.l), (6, next_color.l)]), t),
+                (weight * (next_color.w - curr_color.w)) + curr_color.w,
+                (weight * (next_color.h - curr_color.h)) + curr_color.h,
+                (weight * (next_color.s - curr_color.s)) + curr_color.s,
+                (weight * (next_color.l - curr_color.l)) + curr_color.l,
             ))
 
+        self.timers.lap("blend", start)
         return colors
 
+    def _render_transition_batch(self, t: float, out: tuple[Colors, Colors]) -> Colors | CrossFade:
+        weight = getv(self._fade_func, t)
+        curr_colors = self._render_batch(t, self.pattern, out[0])
+        next_colors = self._render_batch(self.transition_offset + t, self.next_pattern, out[1])
+        # an RGB fade is mixed when it's encoded
+        if self.rgb_fade:
+            return CrossFade(curr_colors, next_colors, weight)
+        start = time.perf_counter()
+
+        for curr, next in (
+            (curr_colors.w, next_colors.w),
+            (curr_colors.h, next_colors.h),
+            (curr_colors.s, next_colors.s),
+            (curr_colors.l, next_colors.l),
+        ):
+            next -= curr
+            next *= weight
+            curr += next
+        curr_colors.clamp()
+        self.timers.lap("blend", start)
+        return curr_colors
+
     @property
     def pattern_name(self) -> str:
         if self.transitioning:
@@ -221,6 +599,8 @@ class Blender:
 
     @property
     def time_str(self) -> str:
+        if self.playback == 1:
+            return f"(PLAYING) {(self._t - self.playback_start):.2f}"
         if self.pause_change:
             if self.transitioning:
                 return f"(PAUSED) -{(self.pattern_end - self._t):.2f}"
@@ -235,7 +615,13 @@ class Blender:
             self.next_pattern = self.patterns[next]
         self.next_pattern.randomize()
 
-    def render(self, t: float) -> list[Color]:
+    # moves pattern, sparkle and streamer state on to time t without drawing
+    def advance(self, t: float):
+        with self._randomness():
+            self._advance(t)
+
+    def _advance(self, t: float):
+        start = time.perf_counter()
         self._t = t
         if t >= self.pattern_end and not (self.pause_change and not self.transitioning):
             self.pattern_start = self.pattern_end
@@ -259,9 +645,12 @@ class Blender:
             else:
                 sparkle_chance = getv(self.pattern.sparkles, t)
 
-            self.sparkles = random.choices(
-                range(len(self.pixels)),
-                k=int(len(self.pixels) * sparkle_chance))
+            # drawn with replacement like random.choices, a pixel picked twice
+            # just sparkles once
+            self.sparkles.fill(False)
+            self.sparkles[self.rng.integers(
+                len(self.field),
+                size=int(len(self.field) * sparkle_chance))] = True
                 
         if t >= self.next_streamer:
             self.next_streamer += self.streamer_delay
@@ -288,34 +677,172 @@ class Blender:
                     new_streamers.append(streamer)
 
             self.streamers = new_streamers
-                
-        if self.transitioning:
+
+        self.timers.lap("tick", start)
+        self.timers.commit(["tick"])
+
+    # the vectorized engine draws into `out` (the field's own buffers by
+    # default) and hands those back, so the next draw into them overwrites it
+    def draw(self, t: float, out: tuple[Colors, Colors] | None=None) -> list[Color] | Colors | CrossFade:
+        with self._randomness():
+            return self._draw(t, out)
+
+    def _draw(self, t: float, out: tuple[Colors, Colors] | None) -> list[Color] | Colors | CrossFade:
+        if self.vectorized:
+            out = out if out is not None else (self.field.colors, self.field.next_colors)
+            if self.transitioning:
+                colors = self._render_transition_batch(t - self.pattern_start, out)
+            else:
+                colors = self._render_batch(t - self.pattern_start, self.pattern, out[0])
+        elif self.transitioning:
             colors = self._render_transition(t - self.pattern_start) 
         else:
             colors = self._render(t - self.pattern_start, self.pattern)
 
+        self.timers.commit(StageTimers.draw_stages)
         return colors
 
-    def write(self, colors):
-        colors = [colors[:400], colors[400:]]
-        for interface, buffer, colors in zip(self.lights.interfaces, self.buffers, colors):
-            buffer.seek(0)
-            for color in colors:
-                buffer.write(color.as_byte(self._t - self.pattern_start))
-            
-            interface._udpclient = self.lights.udpclient
-            interface.udpclient.destination_host = interface.host
-            buffer.seek(0)
-            interface.set_rt_frame_socket(buffer, 3)
+    def render(self, t: float, out: tuple[Colors, Colors] | None=None) -> list[Color] | Colors | CrossFade:
+        self.advance(t)
+        return self.draw(t, out)
+
+    # wire bytes for each device, written into `frames` (the blender's own by default)
+    def encode(self, colors: list[Color] | Colors | CrossFade, frames: list | None=None) -> list:
+        start = time.perf_counter()
+        if isinstance(colors, list):
+            colors = Colors.of(colors)
+        frames = frames if frames is not None else self.frames
+
+        for frame, fade_frame, offset in zip(frames, self.fade_frames, self.lights.offsets):
+            if isinstance(colors, CrossFade):
+                colors.encode(frame, offset, fade_frame)
+            else:
+                encode(colors, frame, offset)
+        self.timers.lap("encode", start)
+        self.timers.commit(["encode"])
+        return frames
+
+    def send(self, frames: list):
+        start = time.perf_counter()
+        if self.sender is not None:
+            self.sender.send(frames)
+        else:
+            self._send_sync(frames)
+        self.timers.lap("send", start)
+        self.timers.commit(["send"])
+        if self.first_frame is None:
+            self.first_frame = time.perf_counter() - self.lights.started
+            print(f"First frame sent {self.first_frame:.2f}s after bring-up started", flush=True)
+
+    def _send_sync(self, frames: list):
+        for idx, (interface, frame) in enumerate(zip(self.lights.interfaces, frames)):
+            changed = None
+            if self.diffs is not None:
+                changed = self.diffs[idx].changed(frame)
+                if not changed:
+                    continue
+            start = time.perf_counter()
+            try:
+                self._send_device(idx, interface, frame, changed)
+            except Exception:
+                self.send_errors[idx] += 1
+                if self.diffs is not None:
+                    self.diffs[idx].reset()
+                raise
+            self.send_latency[idx].add(time.perf_counter() - start)
+
+    def _send_device(self, idx: int, interface: Interface, frame, changed: list[int] | None):
+        token, header = self.rt_headers[idx]
+        if token != interface.session.access_token:
+            token = interface.session.access_token
+            header = rt_header(token)
+            self.rt_headers[idx] = (token, header)
+        for packet in fragments(header, frame, changed):
+            self.lights.socket.sendto(packet, (interface.host, REALTIME_UDP_PORT_NUMBER))
+
+    def write(self, colors: list[Color] | Colors | CrossFade):
+        self.send(self.encode(colors))
+
+    # render and send one frame, handing the send to the pipeline's thread or
+    # the render to the lookahead workers when there are any
+    def frame(self, t: float):
+        start = time.perf_counter()
+        self._frame(t)
+        self.timers.lap("frame", start)
+        self.timers.commit(["frame"])
+
+    def _frame(self, t: float):
+        if self.playback:
+            self._play(t)
+            return
+
+        try:
+            if self.lookahead is not None:
+                self.lookahead.frame(t)
+            elif self.pipeline is not None:
+                self.pipeline.submit(t)
+            else:
+                self.write(self.render(t))
+        except Exception:
+            # keep the lights going from the baked frames if there are any
+            if self.player is None:
+                raise
+            traceback.print_exc()
+            self.send(self.player.frames(t))
+
+    # cross-fades into the player's frames over the usual transition length,
+    # or cuts straight to them
+    def play(self, t: float, fade: bool=True):
+        if self.player is None:
+            return
+        if self.lookahead is not None:
+            self.lookahead.reset()
+        # playing renders and sends on this thread, so let the sender finish first
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        self.playback = 1
+        self.playback_start = t
+        self.playback_fade_start = t if fade else t - self.transition_length
+
+    def stop_playback(self, t: float):
+        if self.playback == 1:
+            self.playback = -1
+            self.playback_fade_start = t
+
+    def toggle_playback(self, t: float):
+        if self.playback == 1:
+            self.stop_playback(t)
+        else:
+            self.play(t)
+
+    def _play(self, t: float):
+        baked = self.player.frames(t - self.playback_start)
+        elapsed = t - self.playback_fade_start
+        if elapsed >= self.transition_length:
+            if self.playback == 1:
+                # the live patterns keep moving underneath, but aren't drawn
+                self.advance(t)
+                self.send(baked)
+                return
+            self.playback = 0
+            if self.lookahead is not None:
+                self.lookahead.reset()
+            if self.pipeline is not None:
+                self.pipeline.start()
+            self._frame(t)
+            return
+
+        weight = getv(self._fade_func, elapsed)
+        if self.playback == -1:
+            weight = 1 - weight
+        frames = self.encode(self.render(t))
+        for frame, other in zip(frames, baked):
+            mix_frames(frame, other, weight)
+        self.send(frames)
 
     def animate(self):
-        start_time = time.time()
-        self.init(start_time)
-        next_frame = start_time + (1/16)
+        self.init(time.time())
+        self.scheduler.start()
         while self.running:
-            colors = self.render(time.time())
-            self.write(colors)
-            while time.time() < next_frame:
-                pass
-
-            next_frame += 1/16
+            self.frame(self.scheduler.frame_time())
+            self.scheduler.wait()
@@ -0,0 +1,255 @@
+import argparse
+import base64
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import os
+import socket
+import sys
+from threading import Thread
+import time
+
+from xled.control import REALTIME_UDP_PORT_NUMBER
+from xled.security import make_challenge_response
+
+from framefile import load_layouts
+from pipeline import LatencyCounter
+from realtime import FRAGMENT_SIZE
+
+TOKEN_LIFETIME = 14400
+FIRMWARE = "2.8.11"
+
+# a spiral of `count` LEDs wound down a cone, about the shape of a tree
+def cone_layout(count: int, turns: float=12.0) -> list[dict]:
+    layout = []
+    for i in range(count):
+        y = i / max(count - 1, 1)
+        r = (1 - y) / 2
+        a = 2 * math.pi * turns * y
+        layout.append({"x": r * math.cos(a), "y": y, "z": r * math.sin(a)})
+    return layout
+
+# what arrives on a device's realtime port. Frames are told apart by their
+# fragment numbers starting over, so with --skip-unchanged the frames that
+# only sent a later fragment run together and the loss figure is meaningless
+class ReceiveStats:
+    def __init__(self, frame_bytes: int):
+        self.frame_bytes = frame_bytes
+        self.fragments = (frame_bytes + FRAGMENT_SIZE - 1) // FRAGMENT_SIZE
+        self.interval = LatencyCounter("frame interval")
+        self.packets = 0
+        self.bytes = 0
+        self.frames = 0
+        self.lost = 0
+        self.rejected = 0
+        self.first = None
+        self.last = None
+        self._seen = set()
+
+    def add(self, fragment: int, size: int, now: float):
+        self.packets += 1
+        self.bytes += size
+        if self.first is None:
+            self.first = now
+        if not self._seen or fragment <= max(self._seen):
+            self._end_frame()
+            if self.last is not None:
+                self.interval.add(now - self.last)
+            self.last = now
+            self.frames += 1
+        self._seen.add(fragment)
+
+    def _end_frame(self):
+        if self._seen:
+            self.lost += self.fragments - len(self._seen)
+        self._seen = set()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.last - self.first) if self.frames > 1 else 0.0
+
+    @property
+    def fps(self) -> float:
+        return (self.frames - 1) / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        rate = self.bytes / self.elapsed / 1000 if self.elapsed else 0.0
+        return (
+            f"{self.frames} frames at {self.fps:.1f} fps, {self.packets} packets, "
+            f"{rate:.1f} kB/s, {self.lost} fragments lost, {self.rejected} rejected; {self.interval}"
+        )
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body: dict, status: int=200):
+        data = json.dumps(dict(body, code=1000)).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _route(self, method: str):
+        device = self.server.device
+        path = self.path.removeprefix("/xled/v1/")
+        if method == "POST" and path == "login":
+            self._reply(device.login(self._body()))
+            return
+        if self.headers.get("X-Auth-Token") != device.token:
+            self.send_error(401)
+            return
+        handler = device.routes.get((method, path))
+        if handler is None:
+            self.send_error(404)
+            return
+        self._reply(handler(self._body()) if method == "POST" else handler())
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+# stands in for one Twinkly controller on `host`: the HTTP endpoints xled
+# logs in, reads the layout and switches modes with, and the realtime UDP
+# port, which records what arrives instead of lighting anything.
+#
+# xled always talks to port 80 and 7777, so each device needs an address of
+# its own, 127.0.0.2, 127.0.0.3 and so on, and port 80 needs root or
+# net.ipv4.ip_unprivileged_port_start lowered
+class DeviceEmulator:
+    def __init__(self, host: str, layout: list[dict], name: str | None=None, http_port: int=80):
+        self.host = host
+        self.layout = layout
+        self.name = name or f"Twinkly_{host.replace('.', '')}"
+        octets = [int(octet) for octet in host.split('.')]
+        self.mac = ":".join(f"{b:02x}" for b in [0x02, 0x00] + octets)
+        self.mode = "movie"
+        self.token = None
+        self.frame = bytearray(4 * len(layout))
+        self.stats = ReceiveStats(len(self.frame))
+        self.routes = {
+            ("POST", "verify"): lambda body: {},
+            ("GET", "gestalt"): self.gestalt,
+            ("GET", "fw/version"): lambda: {"version": FIRMWARE},
+            ("GET", "led/layout/full"): lambda: {"source": "3D", "synthesized": False, "coordinates": self.layout},
+            ("GET", "led/config"): lambda: {"strings": [{"first_led_id": 0, "length": len(self.layout)}]},
+            ("GET", "led/mode"): lambda: {"mode": self.mode},
+            ("POST", "led/mode"): self.set_mode,
+        }
+        self.http = ThreadingHTTPServer((host, http_port), _Handler)
+        self.http.device = self
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind((host, REALTIME_UDP_PORT_NUMBER))
+        self.udp.settimeout(0.2)
+        self.running = False
+        self.threads = []
+
+    def login(self, body: dict) -> dict:
+        challenge = base64.b64decode(body["challenge"])
+        self.token = base64.b64encode(os.urandom(8)).decode()
+        return {
+            "authentication_token": self.token,
+            "authentication_token_expires_in": TOKEN_LIFETIME,
+            "challenge-response": make_challenge_response(challenge, self.mac),
+        }
+
+    def gestalt(self) -> dict:
+        return {
+            "product_name": "Twinkly",
+            "device_name": self.name,
+            "mac": self.mac,
+            "number_of_led": len(self.layout),
+            "led_profile": "RGBW",
+            "fw_family": "G",
+        }
+
+    def set_mode(self, body: dict) -> dict:
+        self.mode = body["mode"]
+        return {}
+
+    def _receive(self):
+        while self.running:
+            try:
+                packet = self.udp.recv(FRAGMENT_SIZE + 64)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            now = time.perf_counter()
+            # version 3: token, two zero bytes and the fragment number
+            if len(packet) < 12 or packet[0] != 3:
+                self.stats.rejected += 1
+                continue
+            if self.token is None or packet[1:9] != base64.b64decode(self.token):
+                self.stats.rejected += 1
+                continue
+            fragment = packet[11]
+            data = packet[12:]
+            start = fragment * FRAGMENT_SIZE
+            self.frame[start:start + len(data)] = data
+            self.stats.add(fragment, len(packet), now)
+
+    def start(self):
+        self.running = True
+        self.threads = [
+            Thread(target=self.http.serve_forever, daemon=True),
+            Thread(target=self._receive, daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running = False
+        self.http.shutdown()
+        self.http.server_close()
+        for thread in self.threads:
+            thread.join()
+        self.udp.close()
+
+    def __repr__(self):
+        return f"DeviceEmulator({self.name} at {self.host}, {len(self.layout)} LEDs, {self.mode}; {self.stats})"
+
+# one emulator per layout, on consecutive loopback addresses from `first`
+def start_emulators(layouts: list[list[dict]], first: str="127.0.0.2") -> list[DeviceEmulator]:
+    base, last = first.rsplit('.', 1)
+    emulators = [
+        DeviceEmulator(f"{base}.{int(last) + i}", layout)
+        for i, layout in enumerate(layouts)
+    ]
+    for emulator in emulators:
+        emulator.start()
+    return emulators
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pretend to be Twinkly controllers on loopback addresses")
+    parser.add_argument("--layout", help="LED layouts as saved by bake.py --save-layout, one device each")
+    parser.add_argument("--devices", type=int, default=1, help="without --layout, how many devices to run")
+    parser.add_argument("--leds", type=int, default=600, help="without --layout, LEDs per device")
+    parser.add_argument("--first", default="127.0.0.2", help="address of the first device")
+    parser.add_argument("--interval", type=float, default=5.0, metavar="SECONDS",
+                        help="how often to print what each device has received")
+    args = parser.parse_args()
+
+    if args.layout:
+        layouts = load_layouts(args.layout)
+    else:
+        layouts = [cone_layout(args.leds) for _ in range(args.devices)]
+    emulators = start_emulators(layouts, args.first)
+    print("Listening on", " ".join(emulator.host for emulator in emulators), flush=True)
+    try:
+        while True:
+            time.sleep(args.interval)
+            for emulator in emulators:
+                print(emulator, flush=True)
+    except KeyboardInterrupt:
+        pass
+    for emulator in emulators:
+        emulator.stop()
+        print(emulator, file=sys.stderr)
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import struct
+
+# baked frames on disk: a header, one LED count per device, then every frame
+# as the wire bytes (w, r, g, b per LED) of all devices back to back
+#
+#   magic    4s   b"TWKF"
+#   version  H
+#   devices  H
+#   leds     I    total over all devices
+#   fps      f
+#   frames   I
+#   fade     I    frames at the start cross-faded in from past the end, so
+#                 the file loops seamlessly, 0 when it doesn't
+#   layout   32s  sha256 of the layouts the frames were rendered for
+#   counts   devices * I
+MAGIC = b"TWKF"
+VERSION = 2
+HEADER = struct.Struct("<4sHHIfII32s")
+
+def layout_hash(layouts: list[list[dict]]) -> bytes:
+    coordinates = [[(p['x'], p['y'], p['z']) for p in layout] for layout in layouts]
+    return hashlib.sha256(json.dumps(coordinates).encode()).digest()
+
+def load_layouts(path: str) -> list[list[dict]]:
+    with open(path) as file:
+        return json.load(file)
+
+def save_layouts(path: str, layouts: list[list[dict]]):
+    with open(path, 'w') as file:
+        json.dump(layouts, file)
+
+class FrameHeader:
+    def __init__(self, counts: list[int], fps: float, frames: int, layout: bytes, fade: int=0):
+        self.counts = counts
+        self.fps = fps
+        self.frames = frames
+        self.layout = layout
+        self.fade = fade
+
+    @property
+    def leds(self) -> int:
+        return sum(self.counts)
+
+    @property
+    def frame_bytes(self) -> int:
+        return 4 * self.leds
+
+    @property
+    def size(self) -> int:
+        return HEADER.size + (4 * len(self.counts))
+
+    def offset(self, frame: int) -> int:
+        return self.size + (frame * self.frame_bytes)
+
+    def pack(self) -> bytes:
+        return HEADER.pack(
+            MAGIC, VERSION, len(self.counts), self.leds, self.fps, self.frames, self.fade, self.layout,
+        ) + struct.pack(f"<{len(self.counts)}I", *self.counts)
+
+    @classmethod
+    def unpack(cls, data: bytes) -> 'FrameHeader':
+        magic, version, devices, leds, fps, frames, fade, layout = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a version {VERSION} frame file")
+        counts = list(struct.unpack_from(f"<{devices}I", data, HEADER.size))
+        if sum(counts) != leds:
+            raise ValueError(f"Frame file counts {counts} don't add up to {leds} LEDs")
+        return cls(counts, fps, frames, layout, fade)
+
+    def __repr__(self):
+        loop = f", {self.fade} frame loop fade" if self.fade else ""
+        return f"FrameHeader({self.counts}, {self.fps}fps, {self.frames} frames{loop}, {self.layout.hex()[:12]})"
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+CACHE = "layouts.cache"
+
+# cheaper than framefile.layout_hash since it skips the JSON
+def layout_checksum(layout: list[dict]) -> bytes:
+    coordinates = np.array([(p['x'], p['y'], p['z']) for p in layout], dtype=float)
+    return hashlib.sha256(coordinates.tobytes()).digest()
+
+# device addresses, LED layouts and the pixel geometry worked out from them,
+# pickled in the working directory like the .pattern files. A device's
+# layout is only reused while its firmware version and LED count match what
+# the device reports. Devices report nothing else about their layout short
+# of the whole thing, so re-mapping the lights in the Twinkly app with the
+# same firmware and LED count isn't noticed: `refresh` starts from an empty
+# cache so everything is fetched again and replaces what was stored. The
+# stored checksum only catches a damaged cache file. Geometry is keyed by
+# the checksums of the layouts it came from, in device order
+class LayoutCache:
+    # geometry for this many sets of layouts is kept, the oldest goes first
+    max_fields = 4
+
+    def __init__(self, path: str=CACHE, refresh: bool=False):
+        self.path = path
+        self.devices = {}
+        self.fields = {}
+        self.hosts = []
+        self.changed = refresh
+        if os.path.exists(path) and not refresh:
+            try:
+                with open(path, 'rb') as file:
+                    data = pickle.load(file)
+                self.devices = data["devices"]
+                self.fields = data["fields"]
+                self.hosts = data.get("hosts", [])
+            except Exception as e:
+                print(f"Ignoring unreadable layout cache {path}: {e}", flush=True)
+
+    # the cached layout and its checksum, or None when it's missing or stale
+    def layout(self, id: str, firmware: str, leds: int) -> tuple[list[dict], bytes] | None:
+        entry = self.devices.get(id)
+        if entry is None or entry["firmware"] != firmware or entry["leds"] != leds:
+            return None
+        if layout_checksum(entry["layout"]) != entry["checksum"]:
+            return None
+        return entry["layout"], entry["checksum"]
+
+    def put_layout(self, id: str, firmware: str, layout: list[dict]) -> bytes:
+        checksum = layout_checksum(layout)
+        self.devices[id] = {
+            "firmware": firmware,
+            "leds": len(layout),
+            "checksum": checksum,
+            "layout": layout,
+        }
+        self.changed = True
+        return checksum
+
+    def field(self, checksums: list[bytes]) -> dict[str, np.ndarray] | None:
+        return self.fields.get(tuple(checksums))
+
+    def put_field(self, checksums: list[bytes], geometry: dict[str, np.ndarray]):
+        key = tuple(checksums)
+        self.fields.pop(key, None)
+        self.fields[key] = geometry
+        while len(self.fields) > self.max_fields:
+            del self.fields[next(iter(self.fields))]
+        self.changed = True
+
+    # the addresses the devices were last reached at, to try before discovery
+    def put_hosts(self, hosts: list[str]):
+        if hosts != self.hosts:
+            self.hosts = hosts
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'wb') as file:
+            pickle.dump({"devices": self.devices, "fields": self.fields, "hosts": self.hosts}, file)
+        os.replace(tmp, self.path)
+        self.changed = False
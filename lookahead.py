@@ -0,0 +1,186 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import os
+import sys
+import threading
+import time
+
+from pipeline import LatencyCounter
+
+# renders upcoming frames in forked worker processes while the main process
+# only paces and sends them.
+#
+# frames sit on a fixed grid of ticks, t = t0 + tick * period. Before every
+# tick the main process and every worker reseed their blender's generators
+# from the tick number and advance() their copy of it, so they all hold the
+# same state for the same tick. Worker w draws and encodes every workers'th
+# tick into its own ring of `ahead` slots in shared memory, and may only reuse
+# a slot once the main process has sent the frame in it.
+#
+# anything that changes the blender outside advance() (the Menu commands) has
+# to go through invalidate(): the workers are stopped, their frames thrown
+# away, and new workers are forked from the updated state on the next frame.
+#
+# the blender's patterns are full of closures that don't pickle, so workers
+# have to be forked rather than spawned. A forked process only gets the thread
+# that forked it, and a lock any other thread held at that moment would stay
+# held in the worker for good, so workers are only forked while no other
+# thread is running.
+class Lookahead:
+    timeout = 5.0
+
+    def __init__(self, blender, workers: int=2, ahead: int=2, seed: int | None=None):
+        self.blender = blender
+        self.workers = workers
+        self.ahead = ahead
+        self.seed = seed if seed is not None else int.from_bytes(os.urandom(4), "little")
+        self.frame_sizes = [len(frame) for frame in blender.frames]
+        self.frame_bytes = sum(self.frame_sizes)
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=self.frame_bytes * workers * ahead)
+        self.context = mp.get_context("fork")
+        self.t0 = None
+        self.period = blender.scheduler.period
+        self.tick = 0
+        self.processes = []
+        self.wait_latency = LatencyCounter("lookahead wait")
+        self.send_latency = LatencyCounter("send")
+        self.restarts = 0
+        self.discarded = 0
+
+    def _slot(self, worker: int, tick: int, start_tick: int) -> list[memoryview]:
+        idx = (worker * self.ahead) + (((tick - start_tick) // self.workers) % self.ahead)
+        offset = idx * self.frame_bytes
+        frames = []
+        for size in self.frame_sizes:
+            frames.append(self.memory.buf[offset:offset + size])
+            offset += size
+        return frames
+
+    def _t(self, tick: int) -> float:
+        return self.t0 + (tick * self.period)
+
+    def _step(self, blender, tick: int):
+        blender.seed_tick(self.seed, tick)
+        blender.advance(self._t(tick))
+
+    def _work(self, worker: int, start_tick: int):
+        blender = self.blender
+        tick = start_tick
+        while True:
+            self._step(blender, tick)
+            if (tick - start_tick) % self.workers == worker:
+                self.credits[worker].acquire()
+                blender.encode(blender.draw(self._t(tick)), self._slot(worker, tick, start_tick))
+                self.done[worker].put(tick)
+            tick += 1
+
+    def start(self):
+        if threading.active_count() > 1:
+            raise RuntimeError(
+                f"Can't fork lookahead workers with {threading.active_count() - 1} other threads running")
+        self.start_tick = self.tick
+        self.credits = [self.context.Semaphore(self.ahead) for _ in range(self.workers)]
+        self.done = [self.context.SimpleQueue() for _ in range(self.workers)]
+        self.processes = [
+            self.context.Process(target=self._work, args=(worker, self.start_tick), daemon=True)
+            for worker in range(self.workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+    def invalidate(self):
+        if not self.processes:
+            return
+        for process in self.processes:
+            process.kill()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.restarts += 1
+
+    # start over on a fresh tick grid from whatever state the blender is in,
+    # for when it was moved on without going through the ticks
+    def reset(self):
+        self.invalidate()
+        self.t0 = None
+        self.tick = 0
+
+    def close(self):
+        self.invalidate()
+        self.memory.close()
+        self.memory.unlink()
+
+    def _next(self) -> list[memoryview]:
+        tick = self.tick
+        worker = (tick - self.start_tick) % self.workers
+        self._step(self.blender, tick)
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        while self.done[worker].empty():
+            if not self.processes[worker].is_alive() or time.perf_counter() > deadline:
+                raise RuntimeError(f"Lookahead worker {worker} stopped at tick {tick}")
+            time.sleep(0.0002)
+        done = self.done[worker].get()
+        if done != tick:
+            raise RuntimeError(f"Lookahead worker {worker} sent tick {done}, expected {tick}")
+        self.wait_latency.add(time.perf_counter() - start)
+        self.tick += 1
+        return self._slot(worker, tick, self.start_tick)
+
+    def _release(self, tick: int):
+        self.credits[(tick - self.start_tick) % self.workers].release()
+
+    # sends the frame for the latest tick at or before t, throwing away the
+    # ones that were rendered for ticks the caller has already missed
+    def frame(self, t: float):
+        if self.t0 is None:
+            self.t0 = t
+        if not self.processes:
+            self.start()
+
+        target = max(self.tick, int((t - self.t0) / self.period))
+        while self.tick < target:
+            self._next()
+            self._release(self.tick - 1)
+            self.discarded += 1
+
+        frames = self._next()
+        start = time.perf_counter()
+        self.blender.send(frames)
+        self.send_latency.add(time.perf_counter() - start)
+        self._release(self.tick - 1)
+
+    def __repr__(self):
+        return (
+            f"Lookahead({self.workers} workers, {self.ahead} ahead, {self.restarts} restarts, "
+            f"{self.discarded} discarded; {self.wait_latency}; {self.send_latency})"
+        )
+
+# frames per second the lookahead can deliver with 1..max_workers workers,
+# sending nothing and pacing nothing
+def scaling_report(blender, max_workers: int, frames: int=200, file=sys.__stdout__):
+    send = blender.send
+    blender.send = lambda frames: None
+    t0 = blender._t
+    tick = 0
+    try:
+        for workers in range(1, max_workers + 1):
+            lookahead = Lookahead(blender, workers)
+            # carry on from where the last run left the blender
+            lookahead.t0 = t0
+            lookahead.tick = tick
+            start = time.perf_counter()
+            for tick in range(tick, tick + frames):
+                lookahead.frame(lookahead._t(tick))
+            tick += 1
+            elapsed = time.perf_counter() - start
+            lookahead.close()
+            print(
+                f"{workers} workers: {frames / elapsed:.1f} fps,",
+                f"waited {lookahead.wait_latency.mean * 1000:.2f}ms per frame",
+                file=file,
+                flush=True,
+            )
+    finally:
+        blender.send = send
@@ -0,0 +1,155 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+from threading import Event, Thread
+
+from timing import BUCKETS
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+class _Writer:
+    def __init__(self):
+        self.lines = []
+
+    def metric(self, name: str, kind: str, help: str):
+        self.lines.append(f"# HELP {name} {help}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, **labels):
+        self.lines.append(f"{name}{_labels(**labels)} {value}")
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+# the blender's counters in Prometheus text format. Everything here is read
+# from counters the frame loop keeps anyway, so collecting costs the loop
+# nothing and a scrape only costs the scraping thread. Each histogram comes
+# from one snapshot, so its buckets, sum and count always agree
+def render(blender) -> str:
+    out = _Writer()
+
+    out.metric("twinky_stage_seconds", "histogram", "Time per frame spent in each render and send stage")
+    for timer in blender.timers.timers.values():
+        buckets, samples, seconds = timer.snapshot()
+        if not samples:
+            continue
+        total = 0
+        for bound, count in zip(BUCKETS, buckets):
+            total += count
+            out.sample("twinky_stage_seconds_bucket", total, stage=timer.name, le=bound)
+        out.sample("twinky_stage_seconds_bucket", samples, stage=timer.name, le="+Inf")
+        out.sample("twinky_stage_seconds_sum", seconds, stage=timer.name)
+        out.sample("twinky_stage_seconds_count", samples, stage=timer.name)
+
+    scheduler = blender.scheduler
+    for name, value, help in [
+        ("twinky_frames_total", scheduler.frames, "Frames the scheduler has paced"),
+        ("twinky_frames_late_total", scheduler.late, "Frames that finished after their deadline"),
+        ("twinky_frames_compressed_total", scheduler.compressed, "Missed frames rendered back to back to catch up"),
+        ("twinky_frames_dropped_total", scheduler.dropped, "Frames skipped to get back on schedule"),
+        ("twinky_frames_caught_up_total", scheduler.caught_up, "Times a late run got back on schedule"),
+    ]:
+        out.metric(name, "counter", help)
+        out.sample(name, value)
+
+    if blender.sender is not None:
+        devices = [
+            (endpoint.host, endpoint.latency, endpoint.packets, endpoint.errors)
+            for endpoint in blender.sender.endpoints
+        ]
+        out.metric("twinky_send_dropped_total", "counter", "Frames replaced before they were sent")
+        out.sample("twinky_send_dropped_total", blender.sender.dropped)
+    else:
+        devices = [
+            (latency.name, latency, None, errors)
+            for latency, errors in zip(blender.send_latency, blender.send_errors)
+        ]
+    out.metric("twinky_device_send_seconds", "summary", "Time to send a frame to each device")
+    for host, latency, _, _ in devices:
+        out.sample("twinky_device_send_seconds_sum", latency.total, device=host)
+        out.sample("twinky_device_send_seconds_count", latency.count, device=host)
+    out.metric("twinky_device_send_max_seconds", "gauge", "Slowest send to each device")
+    for host, latency, _, _ in devices:
+        out.sample("twinky_device_send_max_seconds", latency.max, device=host)
+    out.metric("twinky_device_send_errors_total", "counter", "Failed sends to each device")
+    for host, _, _, errors in devices:
+        out.sample("twinky_device_send_errors_total", errors, device=host)
+    if blender.sender is not None:
+        out.metric("twinky_device_packets_total", "counter", "Realtime packets sent to each device")
+        for host, _, packets, _ in devices:
+            out.sample("twinky_device_packets_total", packets, device=host)
+
+    if blender.first_frame is not None:
+        out.metric("twinky_first_frame_seconds", "gauge", "Time from starting to bring up the lights to the first frame sent")
+        out.sample("twinky_first_frame_seconds", blender.first_frame)
+
+    out.metric("twinky_streamers", "gauge", "Live streamers")
+    out.sample("twinky_streamers", len(getattr(blender, "streamers", [])))
+    out.metric("twinky_transitioning", "gauge", "1 while cross-fading between patterns")
+    out.sample("twinky_transitioning", int(blender.transitioning))
+    out.metric("twinky_playback", "gauge", "1 playing baked frames, -1 fading out of them, 0 live")
+    out.sample("twinky_playback", blender.playback)
+    out.metric("twinky_pattern_info", "gauge", "The pattern being drawn and the one after it")
+    out.sample("twinky_pattern_info", 1, pattern=blender.pattern.name, next=blender.next_pattern.name)
+    return out.text()
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = render(self.server.blender).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+# serves /metrics from its own thread
+class MetricsServer:
+    def __init__(self, blender, port: int=9108, host: str="127.0.0.1"):
+        self.http = ThreadingHTTPServer((host, port), _Handler)
+        self.http.blender = blender
+        self.thread = Thread(target=self.http.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.http.shutdown()
+        self.http.server_close()
+        self.thread.join()
+
+# rewrites `path` every `interval` seconds from its own thread, for node
+# exporter's textfile collector. The file is replaced in one go, so readers
+# never see half of it
+class MetricsFile:
+    def __init__(self, blender, path: str, interval: float=10.0):
+        self.blender = blender
+        self.path = path
+        self.interval = interval
+        self.stopped = Event()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as file:
+            file.write(render(self.blender))
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write()
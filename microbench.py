@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Callable
+
+import numpy as np
+from pytweening import easeInOutCubic, linear
+
+from colors import BaseColor, Color, Colors, FallingColor, SplitColor, WindowColor
+from param import Curve, getv
+from streamer import Streamer
+from topologies import DistortTopology, MirrorTopology, RepeatTopology, SpinTopology, SpiralTopology
+
+BASELINE = "microbench.json"
+
+def _curve(points: int) -> Curve:
+    return Curve(easeInOutCubic, [(i, (i * 0.37) % 1) for i in range(points)])
+
+# each case is a name and a function that sets it up and returns what to
+# time, so building curves and arrays stays out of the numbers. Per pixel
+# cases are one call, batch cases are one call over `pixels` pixels
+def cases(pixels: int) -> dict[str, Callable[[], Callable[[], object]]]:
+    rng = np.random.default_rng(0)
+    pixel_t = rng.random(pixels)
+    pixel_y = rng.random(pixels)
+    scratch = np.empty(pixels)
+
+    def getv_case(param):
+        return lambda: lambda: getv(param, 1.5)
+
+    def curve_case(points: int, batch: bool):
+        def setup():
+            curve = _curve(points)
+            t = pixel_t * curve.length
+            return (lambda: curve(t)) if batch else (lambda: curve(1.5))
+        return setup
+
+    def topology_case(topology, batch: bool):
+        def setup():
+            params = topology.params(1.5)
+            if not batch:
+                return lambda: topology.apply(params, 0.3, 0.6)
+            def run():
+                np.copyto(scratch, pixel_t)
+                return topology.batch(params, scratch, pixel_y)
+            return run
+        return setup
+
+    def color_case(color, batch: bool):
+        def setup():
+            color.init(0.2)
+            params = color.params(1.5)
+            if not batch:
+                return lambda: color.apply(params, 0.1, 0.5, 0.3, 0.6)
+            out = Colors.full(pixels)
+            return lambda: color.batch(params, 0.1, 0.5, pixel_t, pixel_y, out=out)
+        return setup
+
+    def streamer_case(batch: bool):
+        def setup():
+            streamer = Streamer(0.0, 0.0, angle=0.2, spin=1.0, length=0.5, width=0.2, lifetime=10.0)
+            if not batch:
+                return lambda: streamer.contains(4.0, 0.3, 0.6)
+            return lambda: streamer.mask(4.0, pixel_t, pixel_y)
+        return setup
+
+    topologies = {
+        "spin": SpinTopology(0.25),
+        "spiral": SpiralTopology(2.0, 0.5),
+        "distort": DistortTopology(easeInOutCubic, 0.2, -0.1, 0.5),
+        "mirror": MirrorTopology(3.0),
+        "repeat": RepeatTopology(3.0),
+    }
+    colors = {
+        "base": BaseColor(h=0.3, l=0),
+        "window": WindowColor(0.3, [BaseColor(l=0), BaseColor(h=0.5, l=0)]),
+        "split": SplitColor(3, [BaseColor(l=0), BaseColor(h=0.3, l=0), BaseColor(h=0.6, l=0)]),
+        "falling": FallingColor(),
+    }
+
+    all_cases = {
+        "getv.const": getv_case(0.5),
+        "getv.func": getv_case(lambda t: t * 0.5),
+        "getv.curve": getv_case(Curve(linear, [(0, 0), (3, 1)])),
+    }
+    for points in [2, 8, 32]:
+        all_cases[f"curve.{points}"] = curve_case(points, False)
+        all_cases[f"curve.{points}.batch"] = curve_case(points, True)
+    for name, topology in topologies.items():
+        all_cases[f"topology.{name}"] = topology_case(topology, False)
+        all_cases[f"topology.{name}.batch"] = topology_case(topology, True)
+    for name, color in colors.items():
+        all_cases[f"color.{name}"] = color_case(color, False)
+        all_cases[f"color.{name}.batch"] = color_case(color, True)
+    all_cases["streamer.contains"] = streamer_case(False)
+    all_cases["streamer.mask.batch"] = streamer_case(True)
+    all_cases["color.as_byte"] = lambda: Color(0.2, 0.3, 0.8, 0.1).as_byte
+    return all_cases
+
+# a fixed mix of interpreter and small numpy work that cases are timed
+# against, so a machine that's running slower as a whole doesn't read as a
+# slower case
+_calibration_array = np.arange(64, dtype=float)
+
+def calibration() -> float:
+    total = 0.0
+    for i in range(50):
+        total += i * 0.5
+    return total + float(np.sum(_calibration_array * 0.5))
+
+# how many calls of `func` take at least `min_time` seconds
+def _calls(func: Callable[[], object], min_time: float) -> int:
+    number = 1
+    while _sample(func, number) * number < min_time:
+        number *= 2
+    return number
+
+# seconds per call of the CPU time this thread spent, which leaves out the
+# time it was waiting on other processes for the core
+def _sample(func: Callable[[], object], number: int) -> float:
+    start = time.thread_time()
+    for _ in range(number):
+        func()
+    return (time.thread_time() - start) / number
+
+# the time per call of `func` as a multiple of calibration()'s: the median
+# over `repeat` samples of each, taken one after the other
+def measure(func: Callable[[], object], repeat: int=41, min_time: float=0.005) -> float:
+    number = _calls(func, min_time)
+    calibration_number = _calls(calibration, min_time)
+    ratios = []
+    for _ in range(repeat):
+        ratios.append(_sample(func, number) / _sample(calibration, calibration_number))
+    return statistics.median(ratios)
+
+# `only` picks cases by prefix, or by exact name with `exact`
+def run(pixels: int=5000,
+        only: list[str] | None=None,
+        repeat: int=41,
+        exact: bool=False) -> dict[str, float]:
+    results = {}
+    for name, setup in cases(pixels).items():
+        if only and not any(name == prefix if exact else name.startswith(prefix) for prefix in only):
+            continue
+        results[name] = measure(setup(), repeat)
+    return results
+
+# the calibration loop's own time per call, to turn results into rough times
+def calibration_ns(repeat: int=41, min_time: float=0.005) -> float:
+    number = _calls(calibration, min_time)
+    return statistics.median(_sample(calibration, number) for _ in range(repeat)) * 1e9
+
+def load_baseline(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+def save_baseline(path: str, results: dict[str, float], pixels: int):
+    with open(path, 'w') as file:
+        json.dump({
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "pixels": pixels,
+            "relative": results,
+        }, file, indent=2, sort_keys=True)
+
+# the cases that got more than `threshold` slower than the baseline, with
+# how many times slower they got
+def regressions(results: dict[str, float], baseline: dict[str, float], threshold: float) -> dict[str, float]:
+    return {
+        name: ns / baseline[name]
+        for name, ns in results.items()
+        if name in baseline and ns > baseline[name] * (1 + threshold)
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time the per pixel primitives against a stored baseline")
+    parser.add_argument("cases", nargs="*", help="only run cases starting with these, e.g. curve topology.spin")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="store this run as the new baseline")
+    # repeated runs of the same code stay within about 20% of each other
+    parser.add_argument("--threshold", type=float, default=0.4,
+                        help="fail when a case is this fraction slower than its baseline")
+    parser.add_argument("--pixels", type=int, default=5000, help="pixels per batch call")
+    parser.add_argument("--repeat", type=int, default=41, help="samples to take the median of")
+    args = parser.parse_args()
+
+    stored = load_baseline(args.baseline)
+    if stored is None and not args.save:
+        parser.error(f"no baseline at {args.baseline}, run with --save to record one")
+    if stored is not None and "relative" not in stored and not args.save:
+        parser.error(f"{args.baseline} is in an older format, run with --save to record it again")
+    if stored is not None and stored["pixels"] != args.pixels and not args.save:
+        parser.error(f"{args.baseline} was measured with --pixels {stored['pixels']}")
+    baseline = stored.get("relative", {}) if stored is not None else {}
+    unit = calibration_ns(args.repeat)
+    results = run(args.pixels, args.cases, args.repeat)
+    slower = regressions(results, baseline, args.threshold)
+    if slower and not args.save:
+        # a case only fails when it's slower a second time too
+        again = run(args.pixels, list(slower), args.repeat, exact=True)
+        for name, relative in again.items():
+            results[name] = min(results[name], relative)
+        slower = regressions(results, baseline, args.threshold)
+    print(f"{'calibration':>24} {unit:12.1f}ns", flush=True)
+    for name, relative in results.items():
+        line = f"{name:>24} {relative:10.4f}x {relative * unit:12.1f}ns"
+        if name in baseline:
+            line += f" {relative / baseline[name]:6.2f}x baseline"
+        if name in slower:
+            line += "  REGRESSED"
+        print(line, flush=True)
+
+    if args.save:
+        # a partial run only replaces the cases it ran
+        save_baseline(args.baseline, dict(baseline, **results), args.pixels)
+        print(f"Saved baseline to {args.baseline}")
+    elif slower:
+        print(
+            f"\n{len(slower)} of {len(results)} cases are more than {args.threshold:.0%} slower "
+            f"than {args.baseline}: {', '.join(sorted(slower))}",
+            file=sys.stderr,
+        )
+        sys.exit(1)
@@ -1,31 +1,118 @@
-import random
+from bisect import bisect_right
 from typing import Any, Callable, TypeAlias
+import numpy as np
+from pytweening import linear
+
+from utils import source
 
 CurveFunc: TypeAlias = Callable[[float], float]
 ControlPoint: TypeAlias = tuple[float, float]
 ControlPoints: TypeAlias = list[ControlPoint]
 
+# a CurveFunc sampled over [0, 1] and linearly interpolated, for scalars or arrays
+class BakedCurve:
+    def __init__(self, func: CurveFunc, resolution: int=1024):
+        self.func = func
+        self.resolution = resolution
+        self.table = np.array([func(x) for x in (np.arange(resolution + 1) / resolution).tolist()])
+        self.slopes = np.diff(self.table)
+        self._values = self.table.tolist()
+        self._slopes = self.slopes.tolist()
+
+    def __call__(self, ss: float) -> float:
+        if isinstance(ss, np.ndarray):
+            x = np.clip(ss, 0.0, 1.0) * self.resolution
+            i = np.minimum(x.astype(np.int64), self.resolution - 1)
+            return self.table[i] + ((x - i) * self.slopes[i])
+        x = min(1.0, max(0.0, ss)) * self.resolution
+        i = min(int(x), self.resolution - 1)
+        return self._values[i] + ((x - i) * self._slopes[i])
+
+    # worst difference from func over `samples` evenly spaced points in [0, 1]
+    def max_error(self, samples: int=10000) -> float:
+        ss = np.linspace(0.0, 1.0, samples)
+        exact = np.array([self.func(x) for x in ss.tolist()])
+        return float(np.abs(self(ss) - exact).max())
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({getattr(self.func, '__name__', self.func)}, {self.resolution})"
+
+_baked_curves: dict[tuple[CurveFunc, int], BakedCurve] = {}
+_bake_resolution: int | None = None
+
+def bake(func: CurveFunc, resolution: int=1024) -> BakedCurve:
+    if isinstance(func, BakedCurve):
+        return func
+    key = (func, resolution)
+    if key not in _baked_curves:
+        _baked_curves[key] = BakedCurve(func, resolution)
+    return _baked_curves[key]
+
+# every table baked so far, in the order they were first needed
+def baked_curves() -> list[BakedCurve]:
+    return list(_baked_curves.values())
+
+# every Curve made after this call shapes with a baked table instead of the
+# original function; None goes back to the originals
+def bake_curves(resolution: int | None=1024):
+    global _bake_resolution
+    _bake_resolution = resolution
+
 class Curve:
     def __init__(self, shape_func: CurveFunc, control_points: ControlPoints):
         if len(control_points) < 2:
             raise ValueError("Need at least 2 control_points")
             
+        if _bake_resolution is not None and shape_func is not linear:
+            shape_func = bake(shape_func, _bake_resolution)
         self.shape_func = shape_func
         self.control_points = control_points
         self.length = self.control_points[-1][0]
+        # _floors[i] is the earliest start from point i on. It never decreases,
+        # so bisecting it finds the last point starting at or before s even
+        # when the points aren't in order
+        self._floors = [start for start, _ in control_points]
+        for i in range(len(self._floors) - 2, -1, -1):
+            self._floors[i] = min(self._floors[i], self._floors[i + 1])
+        self._segments = None
 
     def _find_control_points(self, s) -> tuple[int, int]:
-        bottom = None
-        for i, [start, _] in enumerate(self.control_points):
-            if start <= s:
-                bottom = i
-
-        if bottom is None:
+        bottom = bisect_right(self._floors, s) - 1
+        if bottom < 0:
             raise ValueError("Couldn't find the bottom")
 
         return (bottom, bottom + 1)
 
+    def _shape(self, ss: np.ndarray) -> np.ndarray:
+        if self.shape_func is linear:
+            return ss
+        if isinstance(self.shape_func, BakedCurve):
+            return self.shape_func(ss)
+        return np.fromiter(map(self.shape_func, ss.tolist()), dtype=float, count=len(ss))
+
+    def _batch(self, t: np.ndarray) -> np.ndarray:
+        if self._segments is None:
+            self._segments = (
+                np.array(self._floors, dtype=float),
+                np.array([start for start, _ in self.control_points], dtype=float),
+                np.array([value for _, value in self.control_points], dtype=float),
+            )
+        floors, starts, values = self._segments
+
+        s = t % self.length
+        bottom = np.searchsorted(floors, s, side='right') - 1
+        if (bottom < 0).any():
+            raise ValueError("Couldn't find the bottom")
+        top = bottom + 1
+
+        start_t = starts[bottom]
+        start_v = values[bottom]
+        ss = (s - start_t) / (starts[top] - start_t)
+        return (self._shape(ss) * (values[top] - start_v)) + start_v
+
     def __call__(self, t: float) -> float:
+        if isinstance(t, np.ndarray):
+            return self._batch(t)
         s = t % self.length
         bottom, top = self._find_control_points(s)
         start_t, start_v = self.control_points[bottom]
@@ -85,13 +172,13 @@ def const(_: float) -> float:
 
 def rand(minv: float=0.0, maxv: float=1.0) -> CurveFunc:
     def func(_: float) -> float:
-        s = random.random()
+        s = source.random.random()
         return (s * (maxv - minv)) + minv
     return func
 
 def choice(choices: Callable[[float], list[Param]] | list[Param]) -> CurveFunc:
     def func(t: float) -> Any:
         c = choices(t) if callable(choices) else choices
-        pick = random.choice(c)
+        pick = source.random.choice(c)
         return getv(pick, t)
     return func
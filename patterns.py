@@ -0,0 +1,41 @@
+import os
+import pickle
+
+from control import (
+    WiredPattern, BasicBitch, CircusTent, CoiledSpring, Confetti, FallingSnow,
+    Galaxus, Groovy, RainbowStorm, SlidingDoor, SpiralTop,
+)
+
+# every pattern, in the order the Menu lists them
+PATTERNS = [
+    BasicBitch, CircusTent, CoiledSpring, Confetti, FallingSnow,
+    Galaxus, Groovy, RainbowStorm, SlidingDoor, SpiralTop,
+]
+
+# where a pattern's configuration is saved, in the working directory
+def pattern_file(pattern: WiredPattern) -> str:
+    return f"{pattern.name.replace(' ', '_').lower()}.pattern"
+
+def save_pattern(pattern: WiredPattern):
+    with open(pattern_file(pattern), 'wb') as file:
+        pickle.dump(pattern._to_dict(), file, pickle.HIGHEST_PROTOCOL)
+
+def load_pattern(pattern: WiredPattern) -> WiredPattern:
+    fname = pattern_file(pattern)
+    if not os.path.exists(fname):
+        print("No configuration found for", pattern.name, flush=True)
+    else:
+        with open(fname, 'rb') as file:
+            pattern._from_dict(pickle.load(file))
+            pattern.configured = True
+            print("Load saved config for", pattern.name, flush=True)
+    return pattern
+
+# a fresh pattern by class name or display name, any case, spaces or underscores
+def find_pattern(name: str) -> WiredPattern:
+    key = name.replace(' ', '_').lower()
+    for cls in PATTERNS:
+        pattern = cls()
+        if key in (cls.__name__.lower(), pattern.name.replace(' ', '_').lower()):
+            return pattern
+    raise ValueError(f"No pattern called {name}")
@@ -0,0 +1,91 @@
+from queue import Queue
+from threading import Thread
+import time
+import traceback
+
+from colors import Colors
+
+class LatencyCounter:
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return (
+            f"{self.name}: {self.count} frames, last {self.last * 1000:.2f}ms, "
+            f"mean {self.mean * 1000:.2f}ms, max {self.max * 1000:.2f}ms"
+        )
+
+_stop = object()
+
+# renders frame N+1 on the caller's thread while a sender thread encodes and
+# sends frame N. Each frame renders into its own pair of color buffers taken
+# from `free`, and the sender hands them back once the frame is on the wire,
+# so when sending falls behind submit() blocks instead of queueing frames up
+class Pipeline:
+    def __init__(self, blender, depth: int=1):
+        self.blender = blender
+        self.depth = depth
+        self.ready = Queue(maxsize=depth)
+        self.free = Queue()
+        # one rendering, `depth` waiting to send and one sending
+        for _ in range(depth + 2):
+            size = len(blender.field)
+            self.free.put((Colors.full(size), Colors.full(size)))
+        self.render_latency = LatencyCounter("render")
+        self.send_latency = LatencyCounter("send")
+        self.stall_latency = LatencyCounter("stall")
+        self._sender = None
+
+    def start(self):
+        if self._sender is not None:
+            return
+        self._sender = Thread(target=self._send_loop, daemon=True)
+        self._sender.start()
+
+    def stop(self):
+        if self._sender is None:
+            return
+        self.ready.put(_stop)
+        self._sender.join()
+        self._sender = None
+
+    def submit(self, t: float):
+        start = time.perf_counter()
+        buffers = self.free.get()
+        rendering = time.perf_counter()
+        self.stall_latency.add(rendering - start)
+        colors = self.blender.render(t, buffers)
+        self.render_latency.add(time.perf_counter() - rendering)
+        self.ready.put((colors, buffers))
+
+    def _send_loop(self):
+        while True:
+            item = self.ready.get()
+            if item is _stop:
+                break
+            colors, buffers = item
+            start = time.perf_counter()
+            try:
+                self.blender.write(colors)
+            except Exception:
+                # a failed send loses this frame, not the whole sender
+                traceback.print_exc()
+            self.send_latency.add(time.perf_counter() - start)
+            self.free.put(buffers)
+
+    def __repr__(self):
+        return f"Pipeline({self.render_latency}; {self.send_latency}; {self.stall_latency})"
@@ -0,0 +1,68 @@
+import mmap
+
+from colors import mix_frames
+from framefile import FrameHeader, layout_hash
+
+# a baked frame file mapped into memory. frames() hands back views straight
+# into the mapping, one per device, so playing needs no rendering or encoding.
+#
+# frames loop. A file baked with a loop fade already runs on from its last
+# frame into its first; any other file loops `loop_fade` seconds short of
+# its end, with those last frames cross-faded into the first ones as they
+# play, which is the only time frames get mixed
+class FramePlayer:
+    loop_fade = 1.0
+
+    def __init__(self, path: str, lights=None):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.data)
+        self.header = FrameHeader.unpack(self.data)
+        if len(self.data) < self.header.offset(self.header.frames):
+            raise ValueError(f"{path} is cut short, expected {self.header.frames} frames")
+        if lights is not None:
+            if lights.counts != self.header.counts:
+                raise ValueError(f"{path} was baked for {self.header.counts} LEDs, these lights have {lights.counts}")
+            if layout_hash([interface.layout for interface in lights.interfaces]) != self.header.layout:
+                print(f"{path} was baked for a different layout", flush=True)
+        if self.header.fade:
+            self.fade = 0
+        else:
+            self.fade = min(int(self.loop_fade * self.header.fps), self.header.frames // 3)
+        self.period = self.header.frames - self.fade
+        self.mixed = memoryview(bytearray(self.header.frame_bytes))
+
+    @property
+    def duration(self) -> float:
+        return self.period / self.header.fps
+
+    # any t plays
+    def index(self, t: float) -> int:
+        return int(t * self.header.fps) % self.period
+
+    def _frame(self, idx: int) -> memoryview:
+        offset = self.header.offset(idx)
+        return self.view[offset:offset + self.header.frame_bytes]
+
+    def frames(self, t: float) -> list[memoryview]:
+        idx = self.index(t)
+        frame = self._frame(idx)
+        if idx < self.fade:
+            self.mixed[:] = frame
+            mix_frames(self.mixed, self._frame(self.period + idx), 1 - (idx / self.fade))
+            frame = self.mixed
+        frames = []
+        offset = 0
+        for count in self.header.counts:
+            frames.append(frame[offset:offset + (4 * count)])
+            offset += 4 * count
+        return frames
+
+    def close(self):
+        self.mixed.release()
+        self.view.release()
+        self.data.close()
+
+    def __repr__(self):
+        return f"FramePlayer({self.path}, {self.header})"
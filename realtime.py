@@ -0,0 +1,219 @@
+import asyncio
+import base64
+from threading import Thread
+import time
+from typing import Callable
+
+from xled.control import REALTIME_UDP_PORT_NUMBER
+
+from pipeline import LatencyCounter
+
+# xled's realtime protocol version 3: each frame goes out in 900 byte
+# fragments, each behind a header of the session token and fragment number
+FRAGMENT_SIZE = 900
+
+def rt_header(token: str) -> bytes:
+    return b"\x03" + base64.b64decode(token) + b"\x00\x00"
+
+def fragments(header: bytes, frame, indices: list[int] | None=None) -> list[bytes]:
+    frame = bytes(frame)
+    if indices is None:
+        indices = range((len(frame) + FRAGMENT_SIZE - 1) // FRAGMENT_SIZE)
+    return [
+        header + bytes([i]) + frame[i * FRAGMENT_SIZE:(i + 1) * FRAGMENT_SIZE]
+        for i in indices
+    ]
+
+# which fragments of a device's frame differ from the last ones it was sent.
+# Unchanged fragments are left out, a frame with no changes isn't sent at all,
+# and every `keepalive` seconds the whole frame goes out regardless so the
+# device stays in rt mode. A send that fails has to reset() it, or the
+# fragments the device missed wouldn't go out again until the keepalive
+class FrameDiff:
+    def __init__(self, keepalive: float=1.0, clock: Callable[[], float]=time.monotonic):
+        self.keepalive = keepalive
+        self.clock = clock
+        self.last = None
+        self.last_full = 0.0
+        self.frames_skipped = 0
+        self.packets_avoided = 0
+        self.bytes_avoided = 0
+
+    def changed(self, frame) -> list[int]:
+        frame = bytes(frame)
+        count = (len(frame) + FRAGMENT_SIZE - 1) // FRAGMENT_SIZE
+        now = self.clock()
+        last = self.last
+        self.last = frame
+        if last is None or len(last) != len(frame) or now - self.last_full >= self.keepalive:
+            self.last_full = now
+            return list(range(count))
+
+        changed = []
+        for i in range(count):
+            chunk = slice(i * FRAGMENT_SIZE, (i + 1) * FRAGMENT_SIZE)
+            if frame[chunk] != last[chunk]:
+                changed.append(i)
+            else:
+                self.packets_avoided += 1
+                self.bytes_avoided += len(frame[chunk])
+        if not changed:
+            self.frames_skipped += 1
+        return changed
+
+    # the device may not have the last frame, so send the next one whole
+    def reset(self):
+        self.last = None
+
+    def __repr__(self):
+        return (
+            f"{self.frames_skipped} frames skipped, {self.packets_avoided} packets "
+            f"and {self.bytes_avoided} bytes avoided"
+        )
+
+# the render thread only ever reads the cached header. keep_token() runs on
+# the sender's loop: it rebuilds the header when the session's token changes
+# and logs in again (in the loop's executor, so the other devices keep
+# sending) once the token is about to expire
+class DeviceEndpoint(asyncio.DatagramProtocol):
+    # seconds between token checks, and how long before expiry to log in again
+    token_check = 1.0
+    token_margin = 60.0
+
+    def __init__(self, interface, diff: FrameDiff | None=None):
+        self.interface = interface
+        self.diff = diff
+        self.host = interface.host
+        self.transport = None
+        self.latency = LatencyCounter(self.host)
+        self.packets = 0
+        self.errors = 0
+        self.last_error = None
+        self._token = None
+        self._header = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        self.errors += 1
+        self.last_error = exc
+        if self.diff is not None:
+            self.diff.reset()
+
+    def header(self) -> bytes:
+        # the first frame follows set_mode logging in, after that the token
+        # is kept up to date from the loop
+        if self._header is None:
+            self._update_header()
+        return self._header
+
+    def _update_header(self):
+        token = self.interface.session.access_token
+        if not token:
+            raise RuntimeError(f"{self.host} isn't logged in")
+        if token != self._token:
+            self._header = rt_header(token)
+            self._token = token
+
+    def _token_due(self) -> bool:
+        session = self.interface.session
+        expires_at = session.client.expires_at
+        return not session.access_token or (
+            expires_at is not None and expires_at - time.time() < self.token_margin
+        )
+
+    async def keep_token(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.token_check)
+            try:
+                if self._token_due():
+                    await loop.run_in_executor(None, self.interface.session.fetch_token)
+                if self.interface.session.access_token:
+                    self._update_header()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+
+    def fragments(self, frame) -> list[bytes]:
+        indices = self.diff.changed(frame) if self.diff is not None else None
+        return fragments(self.header(), frame, indices)
+
+    async def send(self, fragments: list[bytes], submitted: float):
+        try:
+            for fragment in fragments:
+                self.transport.sendto(fragment)
+            self.packets += len(fragments)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = e
+            if self.diff is not None:
+                self.diff.reset()
+        self.latency.add(time.perf_counter() - submitted)
+
+    def __repr__(self):
+        diff = f", {self.diff}" if self.diff is not None else ""
+        return f"{self.latency}, {self.packets} packets, {self.errors} errors{diff}"
+
+# one UDP endpoint per device on an event loop in its own thread. send()
+# snapshots the frames into packets and returns straight away; every device
+# gets its packets concurrently on the loop, so a slow or failing device
+# doesn't hold up the others or the render loop
+class RealtimeSender:
+    def __init__(self, interfaces, skip_unchanged: bool=False):
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.endpoints = [
+            DeviceEndpoint(interface, FrameDiff() if skip_unchanged else None)
+            for interface in interfaces
+        ]
+        self._keepers = []
+        asyncio.run_coroutine_threadsafe(self._connect(), self.loop).result()
+        self.dropped = 0
+        self._sending = None
+
+    async def _connect(self):
+        for endpoint in self.endpoints:
+            await self.loop.create_datagram_endpoint(
+                lambda: endpoint,
+                remote_addr=(endpoint.host, REALTIME_UDP_PORT_NUMBER),
+            )
+            self._keepers.append(self.loop.create_task(endpoint.keep_token()))
+
+    async def _close(self):
+        for keeper in self._keepers:
+            keeper.cancel()
+        await asyncio.gather(*self._keepers, return_exceptions=True)
+        for endpoint in self.endpoints:
+            if endpoint.transport is not None:
+                endpoint.transport.close()
+
+    async def _send(self, fragments: list[list[bytes]], submitted: float):
+        await asyncio.gather(*(
+            endpoint.send(device_fragments, submitted)
+            for endpoint, device_fragments in zip(self.endpoints, fragments)
+        ))
+
+    def send(self, frames: list):
+        # a frame still waiting on the loop is stale by now, so this one replaces it
+        if self._sending is not None and not self._sending.done():
+            self._sending.cancel()
+            self.dropped += 1
+            # the devices never got the dropped frame, so diff against nothing
+            for endpoint in self.endpoints:
+                if endpoint.diff is not None:
+                    endpoint.diff.reset()
+        fragments = [endpoint.fragments(frame) for endpoint, frame in zip(self.endpoints, frames)]
+        self._sending = asyncio.run_coroutine_threadsafe(
+            self._send(fragments, time.perf_counter()), self.loop)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __repr__(self):
+        devices = "; ".join(repr(endpoint) for endpoint in self.endpoints)
+        return f"RealtimeSender({self.dropped} dropped; {devices})"
@@ -0,0 +1,83 @@
+from enum import Enum
+import time
+from typing import Callable
+
+class CatchUp(Enum):
+    # give up on the missed frames and wait for the next tick
+    SKIP = 0
+    # run the missed frames back to back, each at its own tick's time, until
+    # the schedule is met again, dropping them only once more than
+    # max_behind have piled up
+    COMPRESS = 1
+
+# paces a loop to a fixed frame rate on the monotonic clock. wait() sleeps
+# until spin_time before the deadline and only busy-waits the rest, so the
+# loop doesn't hold a core (and the GIL) while it is idle
+class FrameScheduler:
+    spin_time = 0.002
+
+    def __init__(self,
+                 fps: float=16,
+                 policy: CatchUp=CatchUp.SKIP,
+                 max_behind: int=4,
+                 clock: Callable[[], float]=time.monotonic,
+                 sleep: Callable[[float], None]=time.sleep):
+        self.fps = fps
+        self.period = 1 / fps
+        self.policy = policy
+        self.max_behind = max_behind
+        self.clock = clock
+        self.sleep = sleep
+        self.start()
+
+    def start(self):
+        self.next_frame = self.clock() + self.period
+        self.frames = 0
+        self.late = 0
+        self.compressed = 0
+        self.dropped = 0
+        self.caught_up = 0
+        self.behind = False
+
+    def wait(self):
+        self.frames += 1
+        now = self.clock()
+        if now < self.next_frame:
+            if self.behind:
+                self.behind = False
+                self.caught_up += 1
+            remaining = self.next_frame - now
+            if remaining > self.spin_time:
+                self.sleep(remaining - self.spin_time)
+            while self.clock() < self.next_frame:
+                pass
+            self.next_frame += self.period
+            return
+
+        # a frame rendered to catch up started late, it didn't run late
+        if self.behind:
+            self.compressed += 1
+        else:
+            self.late += 1
+        missed = int((now - self.next_frame) / self.period)
+        if self.policy == CatchUp.COMPRESS and missed < self.max_behind:
+            # no sleep, the next frame starts right away
+            self.behind = True
+            self.next_frame += self.period
+        else:
+            self.behind = False
+            self.dropped += missed
+            self.next_frame += (missed + 1) * self.period
+
+    # when the frame about to be rendered was due, as a time on `clock`. On
+    # schedule that's now, while compressing it's the missed tick's time so
+    # the catch-up frames step through the ticks instead of all drawing now
+    def frame_time(self, clock: Callable[[], float]=time.time) -> float:
+        behind = self.clock() - (self.next_frame - self.period)
+        return clock() - max(0.0, behind)
+
+    def __repr__(self):
+        return (
+            f"FrameScheduler({self.fps}fps, {self.frames} frames, {self.late} late, "
+            f"{self.compressed} compressed, {self.dropped} dropped, {self.caught_up} caught up)"
+        )
@@ -1,11 +1,12 @@
 from copy import deepcopy
 from enum import Enum
-import random
 from typing import TypeAlias
+import numpy as np
 from pytweening import linear
 
-from core import Color
+from colors import Color, Colors
 from param import Curve, Param, getv, rand
+from utils import rands, source
 
 class Direction(Enum):
     FROM_BOT = 0
@@ -31,6 +32,12 @@ class StreamerFunc:
         self.ignore_color = ignore_color
         self._h = None
 
+    # the hue offset is fixed when the streamer spawns, so it keeps one hue
+    # for its whole life and doesn't depend on which frames got drawn
+    def init(self, t: float):
+        if self.h is not None:
+            self._h = getv(self.h, t)
+
     def __call__(self, color: Color, t: float, blend: float) -> Color:
         if color.l != -1.0 and self.make_white:
             return Color(
@@ -40,8 +47,6 @@ class StreamerFunc:
             )
 
         h = blend
-        if self.h is not None and self._h is None:
-            self._h = getv(self.h, t)
         h += self._h if self._h is not None else 0
         h += 0 if self.ignore_color else getv(color.h, t)
 
@@ -52,6 +57,27 @@ class StreamerFunc:
             l=getv(self.l, t) if self.l is not None else color.l,
         )
 
+    def batch(self, colors: Colors, t: float, blend: float) -> Colors:
+        white = (
+            colors.l != -1.0
+            if self.make_white else
+            np.zeros(len(colors), dtype=bool)
+        )
+        if white.all():
+            return colors.whiten(white)
+
+        h = blend
+        h += self._h if self._h is not None else 0
+        h = h + (0 if self.ignore_color else colors.h)
+
+        return Colors(
+            getv(self.w, t) if self.w is not None else colors.w,
+            h,
+            getv(self.s, t) if self.s is not None else colors.s,
+            getv(self.l, t) if self.l is not None else colors.l,
+            colors.suppress,
+        ).whiten(white)
+
 class RandomColorStreamerFunc(StreamerFunc):
     def __init__(self,
                  minh: Param=0.0,
@@ -68,6 +94,9 @@ class RandomColorStreamerFunc(StreamerFunc):
     def h(self, t: float) -> float:
         return rand(getv(self.minh, t), getv(self.maxh, t))(t)
 
+    def init(self, t: float):
+        pass
+
     def __call__(self, color: Color, t: float, blend: float) -> Color:
         return Color(
             w=getv(self.w, t) if self.w is not None else color.w,
@@ -76,6 +105,15 @@ class RandomColorStreamerFunc(StreamerFunc):
             l=getv(self.l, t) if self.l is not None else color.l,
         )
 
+    def batch(self, colors: Colors, t: float, blend: float) -> Colors:
+        return Colors(
+            getv(self.w, t) if self.w is not None else colors.w,
+            rands(getv(self.minh, t), getv(self.maxh, t))(len(colors)),
+            getv(self.s, t) if self.s is not None else colors.s,
+            getv(self.l, t) if self.l is not None else colors.l,
+            colors.suppress,
+        )
+
 class Streamer:
     def __init__(self,
                  initial_t: float,
@@ -92,7 +130,7 @@ class Streamer:
         self.norm_t = norm_t
         move_dir = move_dir if move_dir is not None else Direction.FROM_BOT
         spin_dir = spin_dir if spin_dir is not None else Spin.CLOCKWISE
-        angle = angle if angle is not None else random.random()
+        angle = angle if angle is not None else source.random.random()
         spin = spin if spin is not None else 1.0
         length = length if length is not None else 1.0
         width = width if width is not None else 0.1
@@ -100,6 +138,7 @@ class Streamer:
 
         self.reverse = move_dir != Direction.FROM_TOP
         self.func = deepcopy(func) if func is not None else StreamerFunc()
+        self.func.init(norm_t)
         self.move_dir = move_dir
         self.spin_dir = 1 if spin_dir == Spin.CLOCKWISE else -1
         self.angle = angle
@@ -108,34 +147,75 @@ class Streamer:
         self.width = getv(width, norm_t)
         self.lifetime = getv(lifetime, norm_t)
 
+        self._y_func = (
+            Curve(linear, [(0, -self.length), (self.lifetime, 1)])
+            if self.reverse else
+            Curve(linear, [(0, 1), (self.lifetime, -self.length)])
+        )
+
     @property
     def y_func(self):
-        if self.reverse:
-            return Curve(linear, [(0, -self.length), (self.lifetime, 1)])
-        return Curve(linear, [(0, 1), (self.lifetime, -self.length)])
+        return self._y_func
 
     def alive(self, t):
         return t < self.initial_t + self.lifetime
 
-    def contains(self, t, pixel):
+    def band(self, t: float) -> 'StreamerBand | None':
         if not self.alive(t):
+            return None
+        miny = self._y_func(t - self.initial_t)
+        return StreamerBand(
+            miny,
+            miny + self.length,
+            self.spin * self.spin_dir,
+            getv(self.angle, t),
+            self.width,
+        )
+
+    def contains(self, t, pixel_t, pixel_y):
+        band = self.band(t)
+        return band is not None and band.contains(pixel_t, pixel_y)
+
+    def mask(self, t: float, pixel_t: np.ndarray, pixel_y: np.ndarray) -> np.ndarray:
+        band = self.band(t)
+        if band is None:
+            return np.zeros(len(pixel_t), dtype=bool)
+        return band.within(pixel_y) & band.select(pixel_t, pixel_y)
+
+    def __repr__(self):
+        return f"Streamer({self.angle},{self.spin},{self.length},{self.width},{self.lifetime})"
+
+# where a streamer is for one frame: the pixels with miny <= y <= maxy whose
+# angle falls inside a window of the given width that twists with height
+class StreamerBand:
+    def __init__(self, miny: float, maxy: float, twist: float, angle: float, width: float):
+        self.miny = miny
+        self.maxy = maxy
+        self.twist = twist
+        self.angle = angle
+        self.width = width
+
+    def contains(self, pixel_t: float, pixel_y: float) -> bool:
+        if pixel_y < self.miny or pixel_y > self.maxy:
             return False
-        
-        miny = self.y_func(t - self.initial_t)
-        if pixel.y < miny or pixel.y > miny + self.length:
-            return False
-        
-        mino = (
-            (pixel.y * self.spin * self.spin_dir)
-            + getv(self.angle, t)
-        ) % 1
+
+        mino = ((pixel_y * self.twist) + self.angle) % 1
         if mino + self.width > 1.0:
-            return mino < pixel.t or pixel.t < (mino + self.width) - 1
+            return mino < pixel_t or pixel_t < (mino + self.width) - 1
         else:
-            return mino < pixel.t < mino + self.width
+            return mino < pixel_t < mino + self.width
 
-    def __repr__(self):
-        return f"Streamer({self.angle},{self.spin},{self.length},{self.width},{self.lifetime})"
+    def within(self, pixel_y: np.ndarray) -> np.ndarray:
+        return (pixel_y >= self.miny) & (pixel_y <= self.maxy)
+
+    # angular test only, callers are expected to have narrowed pixel_y to the band
+    def select(self, pixel_t: np.ndarray, pixel_y: np.ndarray) -> np.ndarray:
+        mino = ((pixel_y * self.twist) + self.angle) % 1
+        return np.where(
+            mino + self.width > 1.0,
+            (mino < pixel_t) | (pixel_t < (mino + self.width) - 1),
+            (mino < pixel_t) & (pixel_t < mino + self.width),
+        )
 
 class StreamerValue:
     def __init__(self,
@@ -182,9 +262,9 @@ class StreamerChoices:
             pick = (
                 self.choose[0]
                 if self.choose[0] == self.choose[1] else
-                random.randint(*self.choose)
+                source.random.randint(*self.choose)
             )
-            return random.choices(c, k=pick)
+            return source.random.choices(c, k=pick)
         return c
 
 class CombinedChoices(StreamerChoices):
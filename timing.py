@@ -0,0 +1,104 @@
+from bisect import bisect_left
+from threading import Lock
+import time
+
+# histogram bounds in seconds, around the 62.5ms a frame gets at 16fps
+BUCKETS = [0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.03, 0.05, 0.0625, 0.1, 0.25, 0.5, 1.0]
+
+# the last `window` samples of one stage, for rolling percentiles, plus a
+# histogram of every sample for metrics. add() only writes into a ring and
+# bumps a bucket so it can sit in the frame loop, the percentiles are worked
+# out when someone looks. Other threads read the histogram through
+# snapshot(), which can't catch add() half way through
+class RollingTimer:
+    def __init__(self, name: str, window: int=256):
+        self.name = name
+        self.window = window
+        self.samples = []
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.pending = 0.0
+        self.lock = Lock()
+
+    def add(self, seconds: float):
+        bucket = bisect_left(BUCKETS, seconds)
+        with self.lock:
+            if len(self.samples) < self.window:
+                self.samples.append(seconds)
+            else:
+                self.samples[self.count % self.window] = seconds
+            self.count += 1
+            self.total += seconds
+            self.buckets[bucket] += 1
+
+    # per bucket counts, count and total of every sample so far, all as of
+    # the same sample
+    def snapshot(self) -> tuple[list[int], int, float]:
+        with self.lock:
+            return list(self.buckets), self.count, self.total
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    @property
+    def p50(self) -> float:
+        return self.percentile(0.5)
+
+    @property
+    def p95(self) -> float:
+        return self.percentile(0.95)
+
+    @property
+    def max(self) -> float:
+        return max(self.samples, default=0.0)
+
+    def __repr__(self):
+        return (
+            f"{self.name}: p50 {self.p50 * 1000:.2f}ms, "
+            f"p95 {self.p95 * 1000:.2f}ms, max {self.max * 1000:.2f}ms"
+        )
+
+# time per frame spent in each stage of rendering and sending, and in the
+# whole of Blender.frame(). lap() charges the time since `start` to a stage
+# and returns now as the start of the next one. A stage can be charged more
+# than once a frame (both patterns of a transition) and commit() closes the
+# frame for the stages it's given, so stages run on different threads can
+# commit separately
+class StageTimers:
+    stages = [
+        "frame", "tick", "params", "topology", "base", "effects", "sparkles",
+        "streamers", "pixels", "blend", "encode", "send",
+    ]
+    draw_stages = ["params", "topology", "base", "effects", "sparkles", "streamers", "pixels", "blend"]
+
+    def __init__(self, window: int=256):
+        self.timers = {stage: RollingTimer(stage, window) for stage in self.stages}
+
+    def lap(self, stage: str, start: float) -> float:
+        now = time.perf_counter()
+        self.timers[stage].pending += now - start
+        return now
+
+    def commit(self, stages: list[str]):
+        for stage in stages:
+            timer = self.timers[stage]
+            if timer.pending:
+                timer.add(timer.pending)
+                timer.pending = 0.0
+
+    # p50/p95/max in ms of the stages that have run, the slowest p95 first so
+    # the ones to blame survive being cut to the width of a terminal
+    def status(self) -> str:
+        timers = [timer for timer in self.timers.values() if timer.count]
+        timers.sort(key=lambda timer: timer.p95, reverse=True)
+        return " ".join(
+            f"{timer.name} {timer.p50 * 1000:.1f}/{timer.p95 * 1000:.1f}/{timer.max * 1000:.1f}"
+            for timer in timers
+        )
+
+    def __repr__(self):
+        return f"StageTimers({'; '.join(repr(timer) for timer in self.timers.values() if timer.count)})"
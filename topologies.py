@@ -1,27 +1,61 @@
+from typing import Any
+import numpy as np
 from param import Param, CurveFunc, Curve, getv
 
+# params() resolves everything that only depends on t once per frame, then
+# apply() (one pixel) or batch() (whole arrays) reuse the result
 class Topology:
-    def __call__(self, t: float, pixel_t: float, pixel_y: float) -> float:
+    def params(self, t: float) -> Any:
+        return None
+
+    def apply(self, params: Any, pixel_t: float, pixel_y: float) -> float:
         return pixel_t
 
+    def batch(self, params: Any, pixel_t: np.ndarray, pixel_y: np.ndarray) -> np.ndarray:
+        return np.fromiter(
+            (self.apply(params, pt, py) for pt, py in zip(pixel_t.tolist(), pixel_y.tolist())),
+            dtype=float,
+            count=len(pixel_t),
+        )
+
+    def __call__(self, t: float, pixel_t: float, pixel_y: float) -> float:
+        return self.apply(self.params(t), pixel_t, pixel_y)
+
 class SpinTopology(Topology):
     def __init__(self, angle: Param):
         self.angle = angle
 
-    def __call__(self, t: float, pixel_t: float, pixel_y: float) -> float:
-        angle = getv(self.angle, t)
+    def params(self, t: float) -> float:
+        return getv(self.angle, t)
+
+    def apply(self, angle: float, pixel_t: float, pixel_y: float) -> float:
         return (pixel_t + angle) % 1
 
+    def batch(self, angle: float, pixel_t: np.ndarray, pixel_y: np.ndarray) -> np.ndarray:
+        pixel_t += angle
+        pixel_t %= 1
+        return pixel_t
+
 class SpiralTopology(Topology):
     def __init__(self, turn: Param, mid: Param=0):
         self.turn = turn
         self.mid = mid
 
-    def __call__(self, t: float, pixel_t: float, pixel_y: float) -> float:
-        turn = getv(self.turn, t)
-        mid = getv(self.mid, t)
+    def params(self, t: float) -> tuple[float, float]:
+        return getv(self.turn, t), getv(self.mid, t)
+
+    def apply(self, params: tuple[float, float], pixel_t: float, pixel_y: float) -> float:
+        turn, mid = params
         return (pixel_t + ((pixel_y - mid) * turn)) % 1
 
+    def batch(self, params: tuple[float, float], pixel_t: np.ndarray, pixel_y: np.ndarray) -> np.ndarray:
+        turn, mid = params
+        offset = np.subtract(pixel_y, mid)
+        offset *= turn
+        pixel_t += offset
+        pixel_t %= 1
+        return pixel_t
+
 class DistortTopology(Topology):
     def __init__(self,
                  shape_func: CurveFunc,
@@ -33,32 +67,54 @@ class DistortTopology(Topology):
         self.bot_d = bot_d
         self.mid = mid
 
-    def __call__(self, t: float, pixel_t: float, pixel_y: float) -> float:
+    def params(self, t: float) -> Curve:
         top_d = getv(self.top_d, t)
         bot_d = getv(self.bot_d, t)
         mid = getv(self.mid, t)
-        distort_func = Curve(self.shape_func, [
+        return Curve(self.shape_func, [
             (0, 0),
             (mid/2, bot_d),
             (mid, 0),
             ((1-mid)/2, top_d),
             (1, 0),
         ])
+
+    def apply(self, distort_func: Curve, pixel_t: float, pixel_y: float) -> float:
         return pixel_t + getv(distort_func, pixel_y)
 
+    def batch(self, distort_func: Curve, pixel_t: np.ndarray, pixel_y: np.ndarray) -> np.ndarray:
+        pixel_t += getv(distort_func, pixel_y)
+        return pixel_t
+
 class MirrorTopology(Topology):
     def __init__(self, count: Param):
         self.count = count
 
-    def __call__(self, t: float, pixel_t: float, pixel_y: float) -> float:
-        count = getv(self.count, t)
+    def params(self, t: float) -> float:
+        return getv(self.count, t)
+
+    def apply(self, count: float, pixel_t: float, pixel_y: float) -> float:
         r = ((pixel_t * count) % 1) * 2
         return r if r < 1.0 else 2.0 - r
 
+    def batch(self, count: float, pixel_t: np.ndarray, pixel_y: np.ndarray) -> np.ndarray:
+        pixel_t *= count
+        pixel_t %= 1
+        pixel_t *= 2
+        np.subtract(2.0, pixel_t, out=pixel_t, where=pixel_t >= 1.0)
+        return pixel_t
+
 class RepeatTopology(Topology):
     def __init__(self, count: Param):
         self.count = count
 
-    def __call__(self, t: float, pixel_t: float, pixel_y: float) -> float:
-        count = getv(self.count, t)
+    def params(self, t: float) -> float:
+        return getv(self.count, t)
+
+    def apply(self, count: float, pixel_t: float, pixel_y: float) -> float:
         return (pixel_t * count) % 1
+
+    def batch(self, count: float, pixel_t: np.ndarray, pixel_y: np.ndarray) -> np.ndarray:
+        pixel_t *= count
+        pixel_t %= 1
+        return pixel_t
@@ -1,37 +1,48 @@
+import argparse
 import curses
-import os
-import pickle
 from queue import Queue, Empty
 from threading import Thread
+import sys
 import time
-from core import Blender
+from core import Blender, Lights
+from colors import hsl_table, use_hsl_table
 from control import *
+from lookahead import scaling_report
+from param import bake_curves, baked_curves
+from layoutcache import LayoutCache
+from metrics import MetricsFile, MetricsServer
+from patterns import PATTERNS, load_pattern, save_pattern
+from playback import FramePlayer
+from scheduler import CatchUp, FrameScheduler
 
 _sentinel = object()
 
+# applies the next queued command and renders a frame, False once stopped
+def animation_step(animation, command_queue) -> bool:
+    scheduler = animation.scheduler
+    try:
+        command = command_queue.get(False)
+        if command is not None:
+            if command is _sentinel:
+                animation.stop()
+                print("Stopping animation", scheduler, animation.pipeline, animation.lookahead, animation.sender, animation.diffs, animation.timers, flush=True)
+                command_queue.put(_sentinel)
+                return False
+            else:
+                animation.apply(command)
+            command_queue.task_done()
+    except Empty:
+        pass
+
+    animation.frame(scheduler.frame_time())
+    scheduler.wait()
+    return True
+
 def animation_thread_task(animation, command_queue):
-    start_time = time.time()
-    animation.init(start_time)
-    next_frame = start_time + (1/16)
-    while True:
-        try:
-            command = command_queue.get(False)
-            if command is not None:
-                if command is _sentinel:
-                    print("Stopping animation")
-                    command_queue.put(_sentinel)
-                    break
-                else:
-                    command(animation)
-                command_queue.task_done()
-        except Empty:
-            pass
-        
-        colors = animation.render(time.time())
-        animation.write(colors)
-        while time.time() < next_frame:
-            pass
-        next_frame += 1/16
+    animation.init(time.time())
+    animation.scheduler.start()
+    while animation_step(animation, command_queue):
+        pass
 
 def switch_pattern(idx):
     def func(a):
@@ -63,30 +74,27 @@ def randomize_feature(fidx):
         a.pattern.features[fidx].randomize()
     return func
 
+def start_playback(a):
+    a.play(time.time(), fade=False)
+
+def toggle_playback(a):
+    a.toggle_playback(time.time())
+
 def pauseplay(a):
     a.pause_change = not a.pause_change
 
 def toggle_configured(a):
     a.pattern.configured = not a.pattern.configured
-    with open(f"{a.pattern.name.replace(' ', '_').lower()}.pattern", 'wb') as file:
-        pickle.dump(a.pattern._to_dict(), file, pickle.HIGHEST_PROTOCOL)
+    save_pattern(a.pattern)
     print("Saved", a.pattern.name, flush=True)
 
-def load_pattern(pattern: WiredPattern):
-    fname = f"{pattern.name.replace(' ', '_').lower()}.pattern"
-    if not os.path.exists(fname):
-        print("No configuration found for", pattern.name, flush=True)
-    else:
-        with open(fname, 'rb') as file:
-            pattern._from_dict(pickle.load(file))
-            pattern.configured = True
-            print("Load saved config for", pattern.name, flush=True)
-    return pattern
-
+# with `drive` the menu runs the animation itself, a frame per redraw, so
+# the lookahead workers are forked from a process with no other threads
 class Menu:
-    def __init__(self, animation, queue):
+    def __init__(self, animation, queue, drive: bool=False):
         self.animation = animation
         self.queue = queue
+        self.drive = drive
         self.selected_column = 0
         self.selected_row = [0, 0, 0]
         self.curr_pattern = animation.pattern
@@ -142,6 +150,9 @@ class Menu:
         line += '\u255d'
         screen.addstr(h-2, 0, line)
 
+        # bottom shows per stage frame times, p50/p95/max in ms
+        screen.addstr(h-1, 0, self.animation.timers.status()[:w-1])
+
         # left shows patterns
         for i, p in enumerate(self.animation.patterns):
             pair = curses.color_pair(0)
@@ -199,6 +210,8 @@ class Menu:
                 self.queue.put(switch_pattern(self.selected_row[0]))
         elif key == ord(' '):
             self.queue.put(pauseplay)
+        elif key == ord('p'):
+            self.queue.put(toggle_playback)
         elif key == curses.KEY_LEFT:
             self.selected_column = (self.selected_column - 1) % 3
             self.selected_row[self.selected_column] %= self.maxrow[self.selected_column]
@@ -233,8 +246,10 @@ class Menu:
         curses.start_color()
         curses.init_pair(1, curses.COLOR_BLUE, curses.COLOR_BLACK)
 
-        start_time = time.time()
-        next_frame = start_time + (1/16)
+        scheduler = FrameScheduler(16)
+        if self.drive:
+            self.animation.init(time.time())
+            self.animation.scheduler.start()
         while True:
             if self.animation.pattern != self.curr_pattern:
                 self.selected_row[1] = 0
@@ -244,9 +259,14 @@ class Menu:
             self.print_menu(screen)
             if self.handle_input(screen):
                 break
-            while time.time() < next_frame:
+            if self.drive:
+                animation_step(self.animation, self.queue)
+            else:
+                scheduler.wait()
+        if self.drive:
+            # picks up the stop handle_input queued
+            while animation_step(self.animation, self.queue):
                 pass
-            next_frame += 1/16
 
         curses.nocbreak()
         screen.keypad(False)
@@ -254,27 +274,139 @@ class Menu:
         curses.curs_set(1)
 
 
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 if __name__ == "__main__":
-    patterns = [
-        load_pattern(BasicBitch()),
-        load_pattern(CircusTent()),
-        load_pattern(CoiledSpring()),
-        load_pattern(Confetti()),
-        load_pattern(FallingSnow()),
-        load_pattern(Galaxus()),
-        load_pattern(Groovy()),
-        load_pattern(RainbowStorm()),
-        load_pattern(SlidingDoor()),
-        load_pattern(SpiralTop()),
-    ]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", choices=["vector", "pixel"], default="vector",
+                        help="render whole frames with numpy or one pixel at a time")
+    parser.add_argument("--hsl-table", type=int, nargs=3, metavar=("H", "S", "L"),
+                        help="look colors up in a table with this many hue, saturation and lightness steps")
+    parser.add_argument("--baked-curves", type=positive_int, metavar="STEPS",
+                        help="shape curves from tables with this many steps instead of pytweening")
+    parser.add_argument("--rgb-fade", action="store_true",
+                        help="cross-fade between patterns in encoded RGB instead of HSL")
+    parser.add_argument("--fps", type=float, default=16,
+                        help="frames per second sent to the lights")
+    parser.add_argument("--catch-up", choices=["skip", "compress"], default="skip",
+                        help="when rendering falls behind, drop the missed frames or render them back to back")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="send each frame from a separate thread while the next one renders")
+    parser.add_argument("--lookahead", type=int, default=0, metavar="WORKERS",
+                        help="render upcoming frames in this many worker processes, which are forked, "
+                             "so not with --pipeline, --async-send or the metrics exporters")
+    parser.add_argument("--lookahead-scaling", type=int, metavar="WORKERS",
+                        help="report lookahead frame rates for 1 to WORKERS workers and exit")
+    parser.add_argument("--devices", type=int, metavar="COUNT",
+                        help="wait for this many controllers instead of using every one that answers")
+    parser.add_argument("--discover-timeout", type=float, default=5.0, metavar="SECONDS",
+                        help="how long to wait for controllers to answer discovery or a request")
+    parser.add_argument("--hosts", nargs="+", metavar="HOST",
+                        help="use the controllers at these addresses instead of the cached ones or discovery")
+    parser.add_argument("--layout-cache", default="layouts.cache", metavar="FILE",
+                        help="where to keep device addresses and layouts between runs. A cached layout "
+                             "is used while the device reports the same firmware version and LED count, "
+                             "so after re-mapping the lights run once with --no-layout-cache")
+    parser.add_argument("--no-layout-cache", action="store_true",
+                        help="ignore the cache, find the devices and fetch every layout again, "
+                             "and replace the cache with what was found")
+    parser.add_argument("--async-send", action="store_true",
+                        help="send to every controller at once from an asyncio loop")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="only send the parts of each frame that changed, with a full frame every second")
+    parser.add_argument("--play", metavar="FILE",
+                        help="baked frame file to start on; p fades between it and the live patterns, "
+                             "and it's sent whenever live rendering fails")
+    parser.add_argument("--fallback", metavar="FILE",
+                        help="baked frame file to send whenever live rendering fails, without --play")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", metavar="FILE",
+                        help="rewrite Prometheus metrics to this file every --metrics-interval seconds")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, metavar="SECONDS")
+    args = parser.parse_args()
+    if args.play and args.fallback:
+        parser.error("--play already falls back to its own file, --fallback can't pick another one")
+    # Lookahead only forks its workers while no other thread is running
+    if args.lookahead or args.lookahead_scaling:
+        threaded = [
+            flag for flag, used in [
+                ("--pipeline", args.pipeline),
+                ("--async-send", args.async_send),
+                ("--metrics-port", args.metrics_port),
+                ("--metrics-file", args.metrics_file),
+            ]
+            if used
+        ]
+        if threaded:
+            parser.error(f"--lookahead can't be used with {', '.join(threaded)}, which run threads")
+    table = None
+    if args.hsl_table:
+        use_hsl_table(tuple(args.hsl_table))
+        try:
+            table = hsl_table()
+        except ValueError as e:
+            parser.error(str(e))
+    sys.stdout = open('log.txt', 'w')
+    sys.stderr = open('error.txt', 'w')
+    if table is not None:
+        print(f"Built {table} in {table.build_time * 1000:.0f}ms, max error {table.max_error()}", flush=True)
+    if args.baked_curves:
+        bake_curves(args.baked_curves)
+
+    patterns = [load_pattern(cls()) for cls in PATTERNS]
     queue = Queue()
-    animation = Blender(patterns, 0, True)
-    animation.pattern.randomize()
-    animation_thread = Thread(
-        target=animation_thread_task,
-        args=(animation, queue)
+    lights = Lights(
+        args.devices,
+        args.discover_timeout,
+        args.hosts,
+        LayoutCache(args.layout_cache, refresh=args.no_layout_cache),
     )
-    menu = Menu(animation, queue)
-    animation_thread.start()
-    curses.wrapper(menu)
-    animation_thread.join()
+    baked = args.play or args.fallback
+    animation = Blender(
+        patterns,
+        0,
+        True,
+        vectorized=args.engine == "vector",
+        rgb_fade=args.rgb_fade,
+        fps=args.fps,
+        catch_up=CatchUp[args.catch_up.upper()],
+        pipelined=args.pipeline,
+        lookahead=args.lookahead,
+        lights=lights,
+        async_send=args.async_send,
+        skip_unchanged=args.skip_unchanged,
+        player=FramePlayer(baked, lights) if baked else None,
+    )
+    if args.play:
+        queue.put(start_playback)
+    if args.lookahead_scaling:
+        animation.init(time.time())
+        scaling_report(animation, args.lookahead_scaling)
+        sys.exit(0)
+    exporters = []
+    if args.metrics_port:
+        exporters.append(MetricsServer(animation, args.metrics_port))
+    if args.metrics_file:
+        exporters.append(MetricsFile(animation, args.metrics_file, args.metrics_interval))
+    animation.pattern.randomize()
+    # curves are baked as the patterns first build them
+    for curve in baked_curves():
+        print(f"Baked {curve}, max error {curve.max_error():.2g}", flush=True)
+    if args.lookahead:
+        curses.wrapper(Menu(animation, queue, drive=True))
+    else:
+        animation_thread = Thread(
+            target=animation_thread_task,
+            args=(animation, queue)
+        )
+        menu = Menu(animation, queue)
+        animation_thread.start()
+        curses.wrapper(menu)
+        animation_thread.join()
+    for exporter in exporters:
+        exporter.close()
@@ -1,16 +1,44 @@
+from contextlib import contextmanager
 import random
 from typing import Callable
+import numpy as np
+
+# where pattern randomness is drawn from: the random and np.random modules,
+# unless a Blender has swapped in its own per-tick generators while it steps
+# and draws, so seeding a tick never touches the process-wide state
+class RandomSource:
+    def __init__(self):
+        self.random = random
+        self.np = np.random
+
+    @contextmanager
+    def using(self, py: random.Random, np_random: np.random.RandomState):
+        previous = self.random, self.np
+        self.random, self.np = py, np_random
+        try:
+            yield
+        finally:
+            self.random, self.np = previous
+
+source = RandomSource()
 
 def rand(minv=0.0, maxv=1.0) -> Callable[[], float]:
     def func() -> float:
-        s = random.random()
+        s = source.random.random()
+        return (s * (maxv - minv)) + minv
+
+    return func
+
+def rands(minv=0.0, maxv=1.0) -> Callable[[int], np.ndarray]:
+    def func(n: int) -> np.ndarray:
+        s = source.np.random(n)
         return (s * (maxv - minv)) + minv
 
     return func
 
 def choice(choices: list[float]) -> Callable[[], float]:
     def func() -> float:
-        return random.choice(choices)
+        return source.random.choice(choices)
 
     return func
 